@@ -5,9 +5,6 @@ import re
 
 import numpy as np
 
-import astropy.time
-import astropy.units as u
-
 TagEvent = namedtuple("TagEvent", ["start_time", "end_time", "tag", "polarimeter"])
 
 
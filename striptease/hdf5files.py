@@ -1,15 +1,19 @@
 # -*- encoding: utf-8 -*-
 
 from collections import namedtuple
+from collections.abc import Mapping, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import Union, List, Set
+from typing import Dict, Optional, Union, List, Set, Tuple
 
-from astropy.time import Time
 import csv
+import os
+import re
+import threading
 import h5py
 import numpy as np
 from datetime import datetime
-from scipy.interpolate import interp1d
 
 from .biases import BiasConfiguration
 
@@ -18,13 +22,24 @@ __all__ = [
     "HkDescriptionList",
     "DataFile",
     "Tag",
+    "TagList",
+    "MjdArray",
+    "mjd_to_time",
     "scan_data_path",
 ]
 
-VALID_GROUPS = ["BIAS", "DAQ"]
-VALID_SUBGROUPS = ["POL", "BOARD"]
-VALID_DETECTORS = ["Q1", "Q2", "U1", "U2"]
-VALID_DATA_TYPES = ["PWR", "DEM"]
+# Groups and subgroups are listed in the order they are searched by
+# get_group_subgroup
+_GROUPS = ("BIAS", "DAQ")
+_SUBGROUPS = ("POL", "BOARD")
+
+VALID_GROUPS = frozenset(_GROUPS)
+VALID_SUBGROUPS = frozenset(_SUBGROUPS)
+VALID_DETECTORS = frozenset(["Q1", "Q2", "U1", "U2"])
+VALID_DATA_TYPES = frozenset(["PWR", "DEM"])
+
+_VALID_GROUPS_STR = ", ".join(f'"{x}"' for x in _GROUPS)
+_VALID_SUBGROUPS_STR = ", ".join(f'"{x}"' for x in _SUBGROUPS)
 
 #: Information about a tag loaded from a HDF5 file
 #:
@@ -40,18 +55,149 @@ Tag = namedtuple(
 )
 
 
+def _tag_column(name):
+    return property(
+        lambda self: self._data[name], doc=f"Array with the ``{name}`` of each tag"
+    )
+
+
+class TagList(Sequence):
+    """A read-only list of :class:`Tag` objects
+
+    The tags are kept in a NumPy structured array whose fields have the
+    same names as the fields of :class:`Tag`, and a :class:`Tag` object
+    is built only when an element of the list is accessed. Slicing a
+    :class:`TagList` returns a new :class:`TagList`; if you need a list
+    that can be modified, use ``list(tags)``.
+
+    Each field is also available as a NumPy array, which is handy for
+    vectorized searches::
+
+        # Find all the tags that were active at some time
+        mask = (tags.mjd_start <= mjd) & (mjd <= tags.mjd_end)
+        print(tags.name[mask])
+    """
+
+    id = _tag_column("id")
+    mjd_start = _tag_column("mjd_start")
+    mjd_end = _tag_column("mjd_end")
+    name = _tag_column("name")
+    start_comment = _tag_column("start_comment")
+    end_comment = _tag_column("end_comment")
+
+    def __init__(self, tags: np.ndarray):
+        self._data = tags
+
+    @classmethod
+    def from_tag_data(cls, tag_data: np.ndarray):
+        """Build a :class:`TagList` from the table ``TAGS/tag_data``
+
+        The table must have the layout used in Strip HDF5 files, with
+        the string columns stored as byte strings.
+        """
+        # Decode the string columns in bulk instead of one row at a time.
+        # Columns are accessed by position, like the fields of "Tag"
+        columns = [tag_data[name] for name in tag_data.dtype.names]
+        for idx in (3, 4, 5):
+            columns[idx] = np.char.decode(columns[idx], "utf-8")
+
+        tags = np.empty(
+            len(tag_data), dtype=[(x, y.dtype) for x, y in zip(Tag._fields, columns)]
+        )
+        for name, column in zip(Tag._fields, columns):
+            tags[name] = column
+
+        return cls(tags)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return TagList(self._data[idx])
+
+        return Tag._make(self._data[idx].tolist())
+
+    def __iter__(self):
+        return map(Tag._make, self._data.tolist())
+
+    def __repr__(self):
+        return f"TagList({list(self)!r})"
+
+
+#: MJD of the Unix epoch (1970-01-01 00:00:00 UTC)
+UNIX_EPOCH_MJD = 40587.0
+
+
+def mjd_to_time(mjd):
+    "Convert an array of MJDs into a `astropy.time.Time` object"
+
+    # Astropy is slow to import, so do it only when it is really needed
+    from astropy.time import Time
+
+    return Time(np.asarray(mjd, dtype=np.float64), format="mjd")
+
+
+class MjdArray(np.ndarray):
+    """A NumPy array of MJD times that can act as a `astropy.time.Time`
+
+    Building a `astropy.time.Time` object for a long timeline is
+    expensive, and most of the times only the MJD values are needed.
+    For this reason, :meth:`DataFile.load_hk` and
+    :meth:`DataFile.load_sci` return the times as a plain array of
+    MJDs wrapped in this class.
+
+    The attributes ``mjd``, ``value`` and ``unix`` are computed
+    directly from the MJDs; any other attribute of `astropy.time.Time`
+    (e.g., ``datetime`` or ``iso``) triggers the creation of a Time
+    object, which you can also get explicitly by calling
+    :meth:`to_time`::
+
+        time, data = f.load_hk("BIAS", "POL_Y6", "VG4A_SET")
+        print(time.mjd[0])  # Cheap
+        print(time.iso[0])  # This builds a Time object
+    """
+
+    def __new__(cls, mjd):
+        return np.asarray(mjd, dtype=np.float64).view(cls)
+
+    @property
+    def mjd(self):
+        return self.view(np.ndarray)
+
+    @property
+    def value(self):
+        return self.view(np.ndarray)
+
+    @property
+    def unix(self):
+        return (self.view(np.ndarray) - UNIX_EPOCH_MJD) * 86400.0
+
+    def to_time(self):
+        "Return a `astropy.time.Time` object containing the same times"
+
+        return mjd_to_time(self.view(np.ndarray))
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        return getattr(self.to_time(), name)
+
+
 def check_group_and_subgroup(group, subgroup):
     if not group.upper() in VALID_GROUPS:
-        valid_choices = ", ".join(['"' + x + '"' for x in VALID_GROUPS])
-        raise ValueError(f"Group {group.upper()} must be one of {valid_choices}")
+        raise ValueError(f"Group {group.upper()} must be one of {_VALID_GROUPS_STR}")
 
     if not subgroup.upper() in VALID_SUBGROUPS:
-        valid_choices = ", ".join(['"' + x + '"' for x in VALID_SUBGROUPS])
-        raise ValueError(f"Subgroup {subgroup.upper()} must be one of {valid_choices}")
+        raise ValueError(
+            f"Subgroup {subgroup.upper()} must be one of {_VALID_SUBGROUPS_STR}"
+        )
 
     return True
 
 
+@lru_cache(maxsize=32)
 def hk_list_file_name(group, subgroup):
     return (
         Path(__file__).parent.parent
@@ -60,10 +206,10 @@ def hk_list_file_name(group, subgroup):
     )
 
 
-class HkDescriptionList:
+class HkDescriptionList(Mapping):
     """Result of a call to get_hk_descriptions
 
-    This class acts like a dictionary that associates the name of an
+    This class is a read-only mapping that associates the name of an
     housekeeping parameter with a description. It provides a nice
     textual representation when printed on the screen::
 
@@ -79,37 +225,37 @@ class HkDescriptionList:
     """
 
     def __init__(self, group, subgroup, hklist):
-        self.group = subgroup
-        self.subgroup = group
+        self.group = group.upper()
+        self.subgroup = subgroup.upper()
         self.hklist = hklist
+        self._rendered: Optional[str] = None
 
-    def __contains__(self, k):
-        return self.hklist.__contains__(k)
+    def __contains__(self, key):
+        return key in self.hklist
 
-    def __iter__(self, k):
-        return self.hklist.__iter__(k)
+    def __iter__(self):
+        return iter(self.hklist)
 
     def __len__(self):
-        return self.hklist.__len__()
+        return len(self.hklist)
 
     def __getitem__(self, key):
-        return self.hklist.__getitem__(key)
+        return self.hklist[key]
 
     def __str__(self):
-        result = f"Parameters for {self.group}/{self.subgroup}\n\n"
-
-        result += "{:15s}{}\n".format("HK name", "Description")
-
-        table_body = ""
-        linewidth = 0
-        for key in sorted(self.hklist.keys()):
-            cur_line = f"{key:15s}{self.hklist[key]}\n"
-            if len(cur_line) - 1 > linewidth:
-                linewidth = len(cur_line) - 1
+        # The list of parameters never changes, so the table is built
+        # only once
+        if self._rendered is not None:
+            return self._rendered
 
-            table_body += cur_line
+        lines = [f"{key:15s}{self.hklist[key]}" for key in sorted(self.hklist)]
+        linewidth = max(map(len, lines), default=0)
 
-        return result + ("-" * linewidth) + "\n" + table_body
+        header = "Parameters for {}/{}\n\n{:15s}{}\n".format(
+            self.group, self.subgroup, "HK name", "Description"
+        )
+        self._rendered = header + "\n".join(["-" * linewidth] + lines) + "\n"
+        return self._rendered
 
 
 def get_group_subgroup(parameter):
@@ -124,18 +270,26 @@ def get_group_subgroup(parameter):
         group, subgroup (str): the strings of the group and subgroup of the parameter
 
     """
-    for g in VALID_GROUPS:
-        for s in VALID_SUBGROUPS:
-            par_fname = hk_list_file_name(g, s)
-            with par_fname.open(mode="r") as csv_file:
-                csv_reader = csv.DictReader(csv_file)
-                for row in csv_reader:
-                    if parameter == row["HK_PAR"]:
-                        return g, s
+    try:
+        return _param_index()[parameter]
+    except KeyError:
         print("Parameter %s does not exist" % parameter)
         return None, None
 
 
+@lru_cache(maxsize=None)
+def _param_index():
+    # Map the name of each HK parameter to its group and subgroup. If a
+    # name appears in more than one file, the first group/subgroup wins
+    index: Dict[str, Tuple[str, str]] = {}
+    for g in _GROUPS:
+        for s in _SUBGROUPS:
+            for par in _load_hk_csv(g, s):
+                index.setdefault(par, (g, s))
+
+    return index
+
+
 def get_hk_descriptions(group, subgroup):
     """Reads the list of housekeeping parameters with their own description.
 
@@ -158,15 +312,32 @@ def get_hk_descriptions(group, subgroup):
 
     """
     check_group_and_subgroup(group, subgroup)
+
+    group, subgroup = group.upper(), subgroup.upper()
+    return HkDescriptionList(group, subgroup, _load_hk_csv(group, subgroup))
+
+
+@lru_cache(maxsize=32)
+def _load_hk_csv(group, subgroup):
+    # The CSV files are shipped with the package and never change
+    # while the program is running, so each of them is parsed only once
     par_fname = hk_list_file_name(group, subgroup)
 
-    hklist = {}
     with par_fname.open(mode="r") as csv_file:
-        csv_reader = csv.DictReader(csv_file)
-        for row in csv_reader:
-            hklist[row["HK_PAR"]] = row["Description"]
+        csv_reader = csv.reader(csv_file)
+        header = next(csv_reader)
+        hk_idx = header.index("HK_PAR")
+        desc_idx = header.index("Description")
+        hklist = {row[hk_idx]: row[desc_idx] for row in csv_reader if row}
+
+    return hklist
 
-    return HkDescriptionList(group, subgroup, hklist)
+
+# Used to convert datetimes into numbers. The "timestamp" method of
+# naive datetimes is not used, as it depends on the local timezone
+_EPOCH = datetime(1970, 1, 1)
+
+_FNAME_RE = re.compile(r"^(\d{4})_(\d{2})_(\d{2})_(\d{2})-(\d{2})-(\d{2})\.h5$")
 
 
 def parse_datetime_from_filename(filename):
@@ -179,20 +350,27 @@ def parse_datetime_from_filename(filename):
     """
 
     basename = Path(filename).name
+    match = _FNAME_RE.match(basename)
+    if not match:
+        raise RuntimeError(f"Invalid HDF5 filename: {filename}")
+
     try:
-        assert len(basename) == 22
-        return datetime(
-            year=int(basename[0:4]),
-            month=int(basename[5:7]),
-            day=int(basename[8:10]),
-            hour=int(basename[11:13]),
-            minute=int(basename[14:16]),
-            second=int(basename[17:19]),
-        )
-    except:
+        return datetime(*map(int, match.groups()))
+    except ValueError:
         raise RuntimeError(f"Invalid HDF5 filename: {filename}")
 
 
+def _scan_groups(group_names: List[str]) -> Tuple[Set[str], Set[str]]:
+    """Return the set of boards and the set of polarimeters in a list of groups"""
+    boards = {
+        x[6].upper() for x in group_names if len(x) == 7 and x.startswith("BOARD_")
+    }
+    polarimeters = {
+        x[4:6].upper() for x in group_names if len(x) == 6 and x.startswith("POL_")
+    }
+    return boards, polarimeters
+
+
 def scan_board_names(group_names: List[str]) -> Set[str]:
     """Scan a list of group names and return the set of boards in it.
 
@@ -201,12 +379,7 @@ def scan_board_names(group_names: List[str]) -> Set[str]:
         >>> group_names(["BOARD_G", "COMMANDS", "LOG", "POL_G0", "POL_G6"])
         set("G")
     """
-    result = set()  # type: Set[str]
-    for curname in group_names:
-        if (len(curname) == 7) and (curname[0:6] == "BOARD_"):
-            result.add(curname[6].upper())
-
-    return result
+    return _scan_groups(group_names)[0]
 
 
 def scan_polarimeter_names(group_names: List[str]) -> Set[str]:
@@ -217,44 +390,133 @@ def scan_polarimeter_names(group_names: List[str]) -> Set[str]:
         >>> group_names(["BOARD_G", "COMMANDS", "LOG", "POL_G0", "POL_G6"])
         set("G0", "G6")
     """
-    result = set()  # type: Set[str]
-    for curname in group_names:
-        if (len(curname) == 6) and (curname[0:4] == "POL_"):
-            result.add(curname[4:6].upper())
-
-    return result
+    return _scan_groups(group_names)[1]
 
 
-def extract_mean_from_time_range(times, values, time_range=None):
+def extract_mean_from_time_range(times, values, time_range=None, assume_sorted=True):
     """Calculate a mean value for a timeline
 
     Both "times" and "values" must be lists of values with the same
-    length. The parameter `time_range` can either be `None` or a
-    2-element tuple specifying the range of times to consider.
+    length; "times" can be an array of MJDs, a :class:`MjdArray` or a
+    `astropy.time.Time` object. The parameter `time_range` can either
+    be `None` or a 2-element tuple specifying the range of MJDs to
+    consider.
+
+    Unless `assume_sorted` is ``False``, the times must be sorted in
+    ascending order: in this case, the samples within `time_range` are
+    found through a binary search instead of scanning the whole array.
 
     """
 
     assert len(times) == len(values)
 
     if time_range:
-        mjd_times = times.mjd
-        mask = (mjd_times >= time_range[0]) & (mjd_times <= time_range[1])
-        times = times[mask]
-        values = values[mask]
+        mjd_times = np.asarray(getattr(times, "mjd", times))
+
+        if assume_sorted:
+            idx_start = np.searchsorted(mjd_times, time_range[0], side="left")
+            idx_end = np.searchsorted(mjd_times, time_range[1], side="right")
+            selected = values[idx_start:idx_end]
+        else:
+            mask = (mjd_times >= time_range[0]) & (mjd_times <= time_range[1])
+            selected = values[mask]
 
-        if len(values) > 3:
-            average = np.mean(values)
+        if len(selected) > 3:
+            average = np.mean(selected)
         else:
-            # Too few samples in the interval, interpolate
-            # between the two extrema
-            interpfn = interp1d(times, values, kind="previous")
-            average = interpfn(time_range)
+            # Too few samples in the interval, take the last sample
+            # acquired before each of the two extrema
+            idx = np.searchsorted(mjd_times, time_range, side="right") - 1
+            average = np.asarray(values)[np.clip(idx, 0, len(values) - 1)]
     else:
         average = np.mean(values)
 
     return average
 
 
+# Housekeeping parameters used by DataFile.get_average_biases. Each
+# tuple contains the name of the HDF5 dataset, the name of the field in
+# BiasConfiguration, the name of the parameter and of the component in
+# the calibration tables, and a flag telling if the dataset must exist
+_BIAS_HK_PARAMETERS = [
+    (f"{hk_name}{pin}_HK", f"{hk_name}{pin}".lower(), parameter, pin, True)
+    for hk_name, parameter in (("VPIN", "vphsw"), ("IPIN", "iphsw"))
+    for pin in (0, 1, 2, 3)
+] + [
+    (
+        f"{hk_name}{amplifier}_HK".upper(),
+        f"{hk_name}{amplifier}".lower(),
+        parameter,
+        f"H{amplifier}",
+        False,
+    )
+    for parameter, hk_name in (("vgate", "vg"), ("vdrain", "vd"), ("idrain", "id"))
+    for amplifier in ("0", "1", "2", "3", "4", "4A", "5", "5A")
+]
+
+
+# Open HDF5 files, shared among all the DataFile objects that refer to
+# the same path with the same chunk cache settings. Keys are tuples
+# (path, rdcc_nbytes, rdcc_nslots, rdcc_w0, swmr), and each value is a
+# list [file, reference count]
+_FileKey = Tuple[str, int, int, float, bool]
+_OPEN_FILES: Dict[_FileKey, List] = {}
+_OPEN_FILES_LOCK = threading.Lock()
+
+
+def _open_hdf5_file(key: _FileKey) -> h5py.File:
+    path, rdcc_nbytes, rdcc_nslots, rdcc_w0, swmr = key
+    kwargs = dict(rdcc_nbytes=rdcc_nbytes, rdcc_nslots=rdcc_nslots, rdcc_w0=rdcc_w0)
+    if swmr:
+        try:
+            return h5py.File(path, "r", libver="latest", swmr=True, **kwargs)
+        except OSError:
+            # The file was not written in SWMR mode
+            pass
+
+    return h5py.File(path, "r", **kwargs)
+
+
+def _acquire_hdf5_file(key: _FileKey) -> h5py.File:
+    with _OPEN_FILES_LOCK:
+        entry = _OPEN_FILES.get(key)
+        if entry is not None and entry[0]:
+            entry[1] += 1
+            return entry[0]
+
+    # Open the file without holding the lock, so that threads opening
+    # different files (e.g., in scan_data_path) do not wait for each other
+    new_file = _open_hdf5_file(key)
+
+    with _OPEN_FILES_LOCK:
+        entry = _OPEN_FILES.get(key)
+        if entry is None or not entry[0]:
+            entry = [new_file, 0]
+            _OPEN_FILES[key] = entry
+            new_file = None
+
+        entry[1] += 1
+        result = entry[0]
+
+    if new_file is not None:
+        # Another thread opened the same file in the meantime
+        new_file.close()
+
+    return result
+
+
+def _release_hdf5_file(key: _FileKey) -> None:
+    with _OPEN_FILES_LOCK:
+        entry = _OPEN_FILES.get(key)
+        if entry is None:
+            return
+
+        entry[1] -= 1
+        if entry[1] <= 0:
+            del _OPEN_FILES[key]
+            entry[0].close()
+
+
 class DataFile:
     """A HDF5 file containing timelines acquired by Strip
 
@@ -284,16 +546,34 @@ class DataFile:
           of the groups in the HDF5 file. To initialize this field,
           you must call ``DataFile.read_file_metadata`` first.
 
+    - ``boards``: a Python ``set`` object containing the names of the
+          boards whose housekeeping parameters have been saved in
+          this file. It is computed the first time it is accessed.
+
     - ``polarimeters``: a Python ``set`` object containing the names
           of the polarimeters whose measurements have been saved in
-          this file. To initialize this field, you must call
-          ``DataFile.read_file_metadata`` first.
+          this file. It is computed the first time it is accessed.
 
     - ``hdf5_file``: if the file has been opened using
           :meth:`read_file_metadata`, this is the `h5py.File` object.
+          It is shared with any other ``DataFile`` object that has
+          opened the same file, and it is closed only when all of
+          them have called :meth:`close_file`.
+
+    - ``tags``: a :class:`TagList` object, i.e., a read-only list of
+          :class:`Tag` objects. The table of tags is read and decoded
+          the first time this field is accessed.
+
+    The parameters `rdcc_nbytes`, `rdcc_nslots` and `rdcc_w0` set up the
+    chunk cache used by the HDF5 library when the file is opened; see
+    the documentation of `h5py.File`. The default cache (128 MiB) is
+    much larger than the one used by h5py (1 MiB), so that chunked
+    datasets are not decompressed again every time they are accessed.
 
-    - ``tags``: a list of Tag objects; you must call
-      :meth:`read_file_metadata` before reading it.
+    If `swmr` is ``True``, the file is opened in SWMR
+    (single-writer/multiple-readers) mode, so that it can be read while
+    the acquisition software is still writing it. Files that were not
+    written in SWMR mode are opened normally.
 
     This class can be used in ``with`` statements; in this case, it will
     automatically open and close the file::
@@ -303,8 +583,19 @@ class DataFile:
 
     """
 
-    def __init__(self, filepath):
+    def __init__(
+        self,
+        filepath,
+        rdcc_nbytes: int = 128 * 1024 * 1024,
+        rdcc_nslots: int = 10007,
+        rdcc_w0: float = 0.75,
+        swmr: bool = False,
+    ):
         self.filepath = Path(filepath)
+        self.rdcc_nbytes = rdcc_nbytes
+        self.rdcc_nslots = rdcc_nslots
+        self.rdcc_w0 = rdcc_w0
+        self.swmr = swmr
 
         try:
             self.datetime = parse_datetime_from_filename(self.filepath)
@@ -323,39 +614,79 @@ class DataFile:
                     except RuntimeError:
                         pass
 
+        self.hdf5_file = None
+        self._file_key: Optional[_FileKey] = None
         self.hdf5_groups = []
-        self.tags = None
+        self._sci_dtype_cache = {}
+        self._hk_group_cache: Dict[Tuple[str, str], h5py.Group] = {}
+
+        # These are computed the first time they are accessed
+        self._boards: Optional[Set[str]] = None
+        self._polarimeters: Optional[Set[str]] = None
+        self._tags: Optional[TagList] = None
 
     def __str__(self):
         return f'striptease.DataFile("{self.filepath}")'
 
+    def _open(self):
+        "Open the HDF5 file, unless it has already been opened"
+
+        if self.hdf5_file is not None:
+            return
+
+        # Files are opened in read-only mode, so the same h5py.File
+        # object can be shared by all the DataFile objects pointing to it
+        self._file_key = (
+            str(self.filepath.resolve()),
+            self.rdcc_nbytes,
+            self.rdcc_nslots,
+            self.rdcc_w0,
+            self.swmr,
+        )
+        self.hdf5_file = _acquire_hdf5_file(self._file_key)
+        self.hdf5_groups = list(self.hdf5_file)
+        self._sci_dtype_cache = {}
+        self._hk_group_cache = {}
+
     def read_file_metadata(self):
         "Open the file and checks the contents"
 
-        self.hdf5_file = h5py.File(self.filepath, "r")
-        self.hdf5_groups = list(self.hdf5_file)
+        self._open()
 
-        self.boards = scan_board_names(self.hdf5_groups)
-        self.polarimeters = scan_polarimeter_names(self.hdf5_groups)
-
-        self.tags = [
-            Tag(
-                x[0],
-                x[1],
-                x[2],
-                bytes(x[3]).decode("utf-8"),
-                bytes(x[4]).decode("utf-8"),
-                bytes(x[5]).decode("utf-8"),
-            )
-            for x in self.hdf5_file["TAGS"]["tag_data"][:]
-        ]
+    def _scan_groups(self):
+        self._open()
+        self._boards, self._polarimeters = _scan_groups(self.hdf5_groups)
+
+    @property
+    def boards(self):
+        if self._boards is None:
+            self._scan_groups()
+
+        return self._boards
+
+    @property
+    def polarimeters(self):
+        if self._polarimeters is None:
+            self._scan_groups()
+
+        return self._polarimeters
+
+    @property
+    def tags(self):
+        if self._tags is not None:
+            return self._tags
+
+        self._open()
+        self._tags = TagList.from_tag_data(self.hdf5_file["TAGS"]["tag_data"][:])
+        return self._tags
 
     def close_file(self):
         "Close the HDF5 file"
 
-        if self.hdf5_file:
-            self.hdf5_file.close()
+        if self.hdf5_file is not None:
+            _release_hdf5_file(self._file_key)
             self.hdf5_file = None
+            self._hk_group_cache = {}
 
     def __enter__(self):
         # Force opening the file and reading the metadata
@@ -365,7 +696,7 @@ class DataFile:
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.close_file()
 
-    def load_hk(self, group, subgroup, par, verbose=False):
+    def load_hk(self, group, subgroup, par, verbose=False, astropy_time=False):
         """Loads scientific data from one detector of a given polarimeter
 
         Args:
@@ -383,11 +714,14 @@ class DataFile:
 
             verbose (bool): whether to echo the HK being loaded. Default is FALSE
 
+            astropy_time (bool): if ``True``, return the times as a
+                `astropy.time.Time` object. Default is FALSE
+
         Returns:
 
              A tuple containing two NumPy arrays: the stream of times
-             (using the astropy.time.Time datatype), and the stream of
-             data.
+             (a :class:`MjdArray`, which can be converted into a
+             astropy.time.Time object), and the stream of data.
 
         Example::
 
@@ -397,17 +731,43 @@ class DataFile:
             time, data = f.load_hk("POL_Y6", "BIAS", "VG4A_SET")
 
         """
-        if not self.hdf5_groups:
-            self.read_file_metadata()
+        self._open()
 
+        group, subgroup, par = group.upper(), subgroup.upper(), par.upper()
         if verbose:
-            print(f"{group.upper()}, {subgroup.upper()}, {par.upper()}")
-        datahk = self.hdf5_file[subgroup.upper()][group.upper()][par.upper()]
-        hk_time = Time(datahk["m_jd"], format="mjd")
+            print(f"{group}, {subgroup}, {par}")
+        datahk = self._mmap_dataset(self._get_hk_group(group, subgroup)[par])
+        hk_time = MjdArray(datahk["m_jd"])
         hk_data = datahk["value"]
+        if astropy_time:
+            hk_time = hk_time.to_time()
+
         return hk_time, hk_data
 
-    def load_sci(self, polarimeter, data_type, detector=[]):
+    def _get_hk_group(self, group, subgroup):
+        """Return the HDF5 group containing the housekeeping parameters
+
+        The handles are cached, so that repeated calls to :meth:`load_hk`
+        do not walk the hierarchy of the file again. Both `group` and
+        `subgroup` must be in upper case.
+        """
+        key = (subgroup, group)
+        try:
+            return self._hk_group_cache[key]
+        except KeyError:
+            hk_group = self.hdf5_file[key[0]][key[1]]
+            self._hk_group_cache[key] = hk_group
+            return hk_group
+
+    def load_sci(
+        self,
+        polarimeter,
+        data_type,
+        detector=[],
+        astropy_time=False,
+        as_soa=False,
+        out=None,
+    ):
         """Loads scientific data from one detector of a given polarimeter
 
         Args:
@@ -418,20 +778,39 @@ class DataFile:
                 the module.
 
             data_type (str): Type of data to load, either ``DEM`` or
-                ``PWR``.
+                ``PWR``. You can also pass a list, e.g., ``["DEM",
+                "PWR"]``, to read the columns of both types at once.
 
             detector (str): Either ``Q1``, ``Q2``, ``U1`` or ``U2``.
                 You can also pass a list, e.g., ``["Q1", "Q2"]``. If
                 no value is provided for this parameter, all the four
                 detectors will be returned.
 
+            astropy_time (bool): if ``True``, return the times as a
+                `astropy.time.Time` object. Default is FALSE
+
+            as_soa (bool): if ``True`` and more than one detector is
+                requested, return the data as a dictionary of
+                contiguous arrays instead of a structured array.
+                Default is FALSE
+
+            out (numpy.ndarray): if specified, the data are read into
+                this array instead of a newly allocated one. Use
+                :meth:`allocate_sci_buffer` to create it. This is
+                useful to reuse the same memory when loading several
+                timelines with the same length. It is ignored if
+                `as_soa` is ``True``.
+
         Returns:
 
              A tuple containing two NumPy arrays: the stream of times
-             (using the astropy.time.Time datatype), and the stream of
+             (a :class:`MjdArray`, which can be converted into a
+             astropy.time.Time object), and the stream of
              data. For multiple detectors, the latter will be a list
              of tuples, where each column is named either ``DEMnn`` or
-             ``PWRnn``, where ``nn`` is the name of the detector.
+             ``PWRnn``, where ``nn`` is the name of the detector. If
+             `as_soa` is ``True``, it will be a dictionary associating
+             the same names with one array each.
 
 
         Examples::
@@ -455,34 +834,178 @@ class DataFile:
 
         """
 
-        if not self.hdf5_groups:
-            self.read_file_metadata()
+        self._open()
 
-        if len(polarimeter) == 2:
-            polarimeter = "POL_" + polarimeter.upper()
+        polarimeter, column_selector = self._sci_columns(
+            polarimeter, data_type, detector
+        )
+
+        scidata = self._mmap_dataset(self.hdf5_file[polarimeter]["pol_data"])
+
+        scitime = MjdArray(self._read_sci_column(polarimeter, scidata, "m_jd"))
 
-        if not data_type.upper() in VALID_DATA_TYPES:
-            raise ValueError(f"Invalid data type {data_type}")
+        if isinstance(column_selector, str):
+            data = self._read_sci_column(polarimeter, scidata, column_selector, out)
+        elif as_soa:
+            # Read the whole table in one go and split it in columns
+            if not isinstance(scidata, np.ndarray):
+                scidata = scidata[()]
+            data = {x: np.ascontiguousarray(scidata[x]) for x in column_selector}
+        else:
+            data = self._read_sci_columns(polarimeter, scidata, column_selector, out)
+
+        if astropy_time:
+            scitime = scitime.to_time()
+
+        return scitime, data
+
+    def allocate_sci_buffer(self, polarimeter, data_type, detector=[]):
+        """Allocate an array that can be passed to :meth:`load_sci` as `out`
+
+        The parameters have the same meaning as in :meth:`load_sci`. The
+        array is not initialized.
+        """
 
-        data_type = data_type.upper()
+        self._open()
 
+        polarimeter, column_selector = self._sci_columns(
+            polarimeter, data_type, detector
+        )
         scidata = self.hdf5_file[polarimeter]["pol_data"]
 
-        scitime = Time(scidata["m_jd"], format="mjd")
+        if isinstance(column_selector, str):
+            dtype = scidata.dtype[column_selector]
+        else:
+            dtype = self._sci_dtype(polarimeter, scidata, column_selector)
+
+        return np.empty(scidata.shape, dtype=dtype)
+
+    def _sci_columns(self, polarimeter, data_type, detector):
+        """Validate the arguments of :meth:`load_sci`
+
+        Return a pair containing the name of the HDF5 group of the
+        polarimeter and either the name of the column to read (for a
+        single data type and detector) or a tuple of names.
+        """
+
+        if len(polarimeter) == 2:
+            polarimeter = "POL_" + polarimeter.upper()
+
+        if isinstance(data_type, str):
+            data_types = [data_type.upper()]
+        else:
+            data_types = [x.upper() for x in data_type]
+
+        for cur_type in data_types:
+            if not cur_type in VALID_DATA_TYPES:
+                raise ValueError(f"Invalid data type {cur_type}")
 
         if isinstance(detector, str):
-            if not detector.upper() in VALID_DETECTORS:
-                raise ValueError(f"Invalid detector {detector}")
             detector = detector.upper()
+            if not detector in VALID_DETECTORS:
+                raise ValueError(f"Invalid detector {detector}")
 
-            column_selector = f"{data_type}{detector}"
-        else:
-            if not detector:
-                detector = ["Q1", "Q2", "U1", "U2"]
+            if isinstance(data_type, str):
+                return polarimeter, f"{data_types[0]}{detector}"
+
+            detector = [detector]
+
+        if not detector:
+            detector = ["Q1", "Q2", "U1", "U2"]
+
+        return (
+            polarimeter,
+            tuple([f"{cur_type}{x}" for cur_type in data_types for x in detector]),
+        )
+
+    def _read_sci_column(self, polarimeter, scidata, name, out=None):
+        """Read one column of a "pol_data" dataset as a plain array"""
+
+        if isinstance(scidata, np.ndarray):
+            if out is None:
+                # This is a memory map: no need to copy anything
+                return scidata[name]
+
+            out[:] = scidata[name]
+            return out
+
+        if out is None:
+            # Reading a one-field structured array leaves the column
+            # contiguous, so it can be returned as a view without copies
+            return self._read_sci_columns(polarimeter, scidata, (name,))[name]
 
-            column_selector = tuple([f"{data_type}{x}" for x in detector])
+        self._read_sci_columns(
+            polarimeter, scidata, (name,), out.view([(name, out.dtype)])
+        )
+        return out
+
+    def _sci_dtype(self, polarimeter, scidata, column_selector):
+        "Return the dtype of a structured array containing some sci columns"
+
+        key = (polarimeter, column_selector)
+        try:
+            return self._sci_dtype_cache[key]
+        except KeyError:
+            dtype = np.dtype([(x, scidata.dtype[x]) for x in column_selector])
+            self._sci_dtype_cache[key] = dtype
+            return dtype
+
+    def _read_sci_columns(self, polarimeter, scidata, column_selector, out=None):
+        """Read a subset of the columns of a "pol_data" dataset
+
+        Reading all the columns at once into a preallocated structured
+        array via ``read_direct`` avoids the per-field copies that h5py
+        performs when a tuple of field names is used as a selector.
+        """
+        if out is None:
+            dtype = self._sci_dtype(polarimeter, scidata, column_selector)
+            out = np.empty(scidata.shape, dtype=dtype)
+        elif out.shape != scidata.shape:
+            raise ValueError(
+                f"The buffer has shape {out.shape}, but {scidata.shape} is needed"
+            )
+
+        if isinstance(scidata, np.ndarray):
+            # This is a memory map, just copy the columns
+            for name in column_selector:
+                out[name] = scidata[name]
+        elif out.size > 0:
+            scidata.read_direct(out)
+
+        return out
+
+    def _mmap_dataset(self, dataset):
+        """Return a memory map of a HDF5 dataset, if possible
+
+        Datasets that are stored contiguously and without compression
+        can be mapped directly from the file: the OS page cache is then
+        used instead of copying the data through the HDF5 library. The
+        map is copy-on-write, so that the arrays returned to the caller
+        are writable like the ones produced by h5py. If the dataset
+        cannot be mapped, it is returned unchanged.
+        """
 
-        return scitime, scidata[column_selector]
+        if (
+            dataset.chunks is not None
+            or dataset.compression is not None
+            or dataset.external is not None
+            or dataset.dtype.hasobject
+            or dataset.size == 0
+            or self.hdf5_file.userblock_size != 0
+        ):
+            return dataset
+
+        offset = dataset.id.get_offset()
+        if offset is None:
+            return dataset
+
+        return np.memmap(
+            self.filepath,
+            dtype=dataset.dtype,
+            mode="c",
+            offset=offset,
+            shape=dataset.shape,
+        )
 
     def get_average_biases(
         self, polarimeter, time_range=None, calibration_tables=None
@@ -504,76 +1027,116 @@ class DataFile:
                 are expressed in ADUs.
 
         """
-        result = {}
+        self._open()
+
+        # All the housekeeping parameters used here belong to the same
+        # HDF5 group: descend into it and list its datasets just once,
+        # instead of walking the full path for every parameter
+        hk_group = self._get_hk_group("BIAS", f"POL_{polarimeter.upper()}")
+        hk_datasets = set(hk_group.keys())
+
+        def average_bias_hk(par):
+            datahk = self._mmap_dataset(hk_group[par])
+            if not time_range:
+                # Times are not needed, so read just the "value" field
+                return np.mean(datahk["value"])
+
+            # Read the whole table at once, if it cannot be mapped in
+            # memory: accessing the "m_jd" and "value" fields separately
+            # would read the dataset twice
+            if isinstance(datahk, h5py.Dataset):
+                datahk = datahk[()]
+            return extract_mean_from_time_range(
+                MjdArray(datahk["m_jd"]), datahk["value"], time_range
+            )
 
-        hk_name_to_parameter = {
-            "VPIN": "vphsw",
-            "IPIN": "iphsw",
-        }
-        for param_name in hk_name_to_parameter.keys():
-            for phsw_pin in (0, 1, 2, 3):
-                times, values = self.load_hk(
-                    group="BIAS",
-                    subgroup=f"POL_{polarimeter}",
-                    par=f"{param_name}{phsw_pin}_HK",
+        result = {}
+        for hk_name, field, parameter, component, required in _BIAS_HK_PARAMETERS:
+            if not required and hk_name not in hk_datasets:
+                # This usually happens with names like "VD4A_HK";
+                # we simply ignore them
+                continue
+
+            average = average_bias_hk(hk_name)
+
+            if calibration_tables:
+                average = calibration_tables.adu_to_physical_units(
+                    polarimeter=polarimeter,
+                    hk=parameter,
+                    component=component,
+                    value=average,
                 )
 
-                average = extract_mean_from_time_range(times, values, time_range)
-
-                if calibration_tables:
-                    average = calibration_tables.adu_to_physical_units(
-                        polarimeter=polarimeter,
-                        hk=hk_name_to_parameter[param_name],
-                        component=phsw_pin,
-                        value=average,
-                    )
-
-                x = f"{param_name}{phsw_pin}".lower()
-                result[x] = average
-
-        parameter_to_hk_name = {
-            "vgate": "vg",
-            "vdrain": "vd",
-            "idrain": "id",
-        }
-        for parameter in parameter_to_hk_name.keys():
-            for amplifier in ["0", "1", "2", "3", "4", "4A", "5", "5A"]:
-                try:
-                    times, values = self.load_hk(
-                        group="BIAS",
-                        subgroup=f"POL_{polarimeter}",
-                        par=f"{parameter_to_hk_name[parameter]}{amplifier}_HK",
-                    )
-                except KeyError:
-                    # This usually happens with names like "VD4A_HK";
-                    # we simply ignore them
-                    continue
-
-                average = extract_mean_from_time_range(times, values, time_range)
-
-                if calibration_tables:
-                    average = calibration_tables.adu_to_physical_units(
-                        polarimeter=polarimeter,
-                        hk=parameter,
-                        component=f"H{amplifier}",
-                        value=average,
-                    )
-
-                x = f"{parameter_to_hk_name[parameter]}{amplifier}".lower()
-                result[x] = average
+            result[field] = average
 
         return BiasConfiguration(**result)
 
 
-def scan_data_path(path: Union[str, Path]) -> List[DataFile]:
-    result = []  # type: List[DataFile]
-    for file_name in Path(path).glob("**/*.h5"):
-        # file_name is a Path object
-        curfile = DataFile(file_name)
-        try:
-            curfile.read_file_metadata()
-        except OSError:
-            pass
-        result.append(curfile)
+def _iter_h5(root: Union[str, Path]):
+    """Recursively yield the paths of the ``.h5`` files found in `root`
+
+    Paths are returned as strings: DataFile converts them into ``Path``
+    objects anyway. Like ``Path.glob("**/*.h5")``, symbolic links to
+    directories are not followed and unreadable directories are skipped.
+    """
+    try:
+        entries = os.scandir(root)
+    except OSError:
+        return
+
+    with entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _iter_h5(entry.path)
+            elif entry.name.endswith(".h5") and entry.is_file():
+                yield entry.path
+
 
-    return sorted(result, key=lambda n: n.datetime)
+def _open_one(file_name: str) -> DataFile:
+    curfile = DataFile(file_name)
+    try:
+        curfile.read_file_metadata()
+    except OSError:
+        pass
+
+    return curfile
+
+
+def scan_data_path(
+    path: Union[str, Path],
+    read_metadata: bool = False,
+    max_workers: Optional[int] = None,
+) -> List[DataFile]:
+    """Return a list of the HDF5 files in `path` and its subdirectories
+
+    The list is sorted in chronological order, using the date and time
+    encoded in the name of each file. By default, the files are not
+    opened: their boards, polarimeters and tags are read the first time
+    they are accessed.
+
+    If `read_metadata` is ``True``, the files are opened concurrently
+    using a pool of `max_workers` threads (by default, four times the
+    number of CPUs, up to 32). If the data are saved on a slow hard
+    disk, consider passing a small value like 2 or 4 to `max_workers`.
+    """
+    file_names = _iter_h5(path)
+
+    if read_metadata:
+        if not max_workers:
+            max_workers = min(32, (os.cpu_count() or 1) * 4)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            result = list(executor.map(_open_one, file_names))
+    else:
+        result = [DataFile(x) for x in file_names]
+
+    # Files whose date is unknown are put at the end of the list
+    keys = np.fromiter(
+        (
+            (x.datetime - _EPOCH).total_seconds() if x.datetime is not None else np.inf
+            for x in result
+        ),
+        dtype=np.float64,
+        count=len(result),
+    )
+    return [result[idx] for idx in np.argsort(keys, kind="stable")]
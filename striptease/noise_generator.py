@@ -1,49 +1,102 @@
 # coding=utf-8
 
+from dataclasses import dataclass, field
+from functools import lru_cache
+import math
 
+import numpy as np
+
+_K = 1.38066e-23  # Boltzmann constant
+_H = 6.62608e-34  # Planck constant
+_H_OVER_K = _H / _K
+_SQRT2 = math.sqrt(2.0)
+
+
+@lru_cache(maxsize=8)
+def _spectrum_shape(fknee, slope, n_samples, samp_freq, fmin, fmax):
+    """Return the square root of the 1/f spectrum used by noise_kernel
+
+    The result depends only on the shape of the spectrum, which is
+    usually the same for all the realizations in a simulation, so it is
+    cached. The array is read-only, as it is shared among callers.
+    """
+
+    n_half = int(n_samples / 2.0)
+
+    newknee = fknee * n_samples / samp_freq
+    new_f_min = fmin * n_samples / samp_freq
+    new_f_max = fmax * n_samples / samp_freq
+
+    indexarr = np.arange(1, n_half + 1, dtype=np.float64)
+
+    # funphi = 2/π (arctan(i/new_f_min) - arctan(i/new_f_max)), computed
+    # in place to avoid temporary arrays
+    funphi = np.arctan(indexarr / new_f_min)
+    tmp = np.divide(indexarr, new_f_max)
+    funphi -= np.arctan(tmp, out=tmp)
+    funphi *= 2.0 / np.pi
+
+    # sqr_spectrum = sqrt((newknee / i * funphi) ** (-slope)), written as
+    # exp(-slope/2 log(...)), which is quicker than np.power here
+    sqr_spectrum = np.divide(newknee, indexarr, out=tmp)
+    sqr_spectrum *= funphi
+    np.log(sqr_spectrum, out=sqr_spectrum)
+    sqr_spectrum *= -0.5 * slope
+    np.exp(sqr_spectrum, out=sqr_spectrum)
+
+    sqr_spectrum.flags.writeable = False
+    return sqr_spectrum
+
+
+def _random_seed():
+    return np.random.uniform() * 1e6
+
+
+@dataclass
 class NoiseGenerator:
     """This class generates noise datastreams characterized by white_noise only or
-    white_noise + 1/f spectrum"""
-
-    def __init__(self):
-
-        import numpy as np
-
-        self.fmin = [1.0e-30, "%sfmin = %s%s: Minimum frequency to be considered\n"]
-        self.fmax = [1.0e30, "%sfmin = %s%s: Maximum frequency to be considered\n"]
-        self.A = [
-            1.5e-5,
-            "%sA = %s%s: constant defining amplifier fluctuations. "
-            "Typical value for 30 GHz is A = 1.5e-5(default), and "
-            "for 70 GHz is A = 2.8e-5)\n",
-        ]
-        self.Ns = [4, "%sNs = %s%s: number of amplifier stages.\n"]
-        self.corr = [
-            True,
-            "%scorr = %s%s: whether to consider correlated DG/G and DTn/Tn\n",
-        ]
-        self.add_offset = [
-            True,
-            "%sadd_offset = %s%s: whether to add the signal level to "
-            "the generated noise\n",
-        ]
-        self.iseed_1overf = [
-            np.random.uniform() * 1e6,
-            "%siseed_1overf = %s%s: seed for 1/f noise generation\n",
-        ]
-        self.iseed_wn = [
-            np.random.uniform() * 1e6,
-            "%siseed_wn = %s%s: seed for white noise generation\n",
-        ]
-        self.wn_only = [
-            False,
-            "%swn_only = %s%s: whether to consider white noise only\n",
-        ]
-        self.total_power = [
-            False,
-            "%stotal_power = %s%s: whether to generate a total power or "
-            "a differential noise stream\n",
-        ]
+    white_noise + 1/f spectrum
+
+    The parameters of the generator are plain attributes; call
+    :meth:`.parameters` to print them together with their meaning.
+    """
+
+    fmin: float = 1.0e-30
+    fmax: float = 1.0e30
+    A: float = 1.5e-5
+    Ns: int = 4
+    corr: bool = True
+    add_offset: bool = True
+    iseed_1overf: float = field(default_factory=_random_seed)
+    iseed_wn: float = field(default_factory=_random_seed)
+    wn_only: bool = False
+    total_power: bool = False
+    fast_length: bool = False
+
+    # Quantities computed by _total_power_components for the last set of
+    # parameters it was called with
+    _cache_key: tuple = field(default=None, init=False, repr=False, compare=False)
+    _cached_components: tuple = field(
+        default=None, init=False, repr=False, compare=False
+    )
+
+    _HELP = {
+        "fmin": "Minimum frequency to be considered",
+        "fmax": "Maximum frequency to be considered",
+        "A": "constant defining amplifier fluctuations. "
+        "Typical value for 30 GHz is A = 1.5e-5(default), and "
+        "for 70 GHz is A = 2.8e-5)",
+        "Ns": "number of amplifier stages.",
+        "corr": "whether to consider correlated DG/G and DTn/Tn",
+        "add_offset": "whether to add the signal level to the generated noise",
+        "iseed_1overf": "seed for 1/f noise generation",
+        "iseed_wn": "seed for white noise generation",
+        "wn_only": "whether to consider white noise only",
+        "total_power": "whether to generate a total power or "
+        "a differential noise stream",
+        "fast_length": "whether to round the number of samples up to a "
+        "length that is quick to transform with FFTs",
+    }
 
     # METHODS
 
@@ -51,18 +104,25 @@ class NoiseGenerator:
         """Prints the attributes of the class, corresponding to the values of
         the spectrum calculation parameters"""
 
-        items = list(self.__dict__.items())
         CRED = "\033[91m"
         CEND = "\033[0m"
 
-        for item in items:
-            print(item[1][1] % (CRED, item[1][0], CEND))
+        for name, description in self._HELP.items():
+            print(f"{CRED}{name} = {getattr(self, name)}{CEND}: {description}")
 
     def set_default(self):
         self.__init__()
 
     def generate_noise(
-        self, frequency, bandwidth, parameters, slope, samp_freq, time_length
+        self,
+        frequency,
+        bandwidth,
+        parameters,
+        slope,
+        samp_freq,
+        time_length,
+        dtype=np.float64,
+        rng=None,
     ):
         """
         This pogram generates a white noise + 1/f stream according to
@@ -85,6 +145,10 @@ class NoiseGenerator:
         slope (slope of 1/f -1 < slope < 0)
         samp_freq (sampling frequency in Hz)
         time_length (in seconds)
+        dtype (type of the output samples, e.g., np.float32 to halve the
+            memory; 1/f spectra are always computed in double precision)
+        rng (a np.random.Generator; if given, the seeds in iseed_1overf and
+            iseed_wn are ignored and independent streams are spawned from it)
         ;
 
 
@@ -92,131 +156,212 @@ class NoiseGenerator:
         noise_out (noise stream)
         """
 
-        import numpy as np
-
-        freq9 = np.double(frequency * 1.0e9)
-        beta9 = np.double(bandwidth * 1.0e9)
-        fmin = np.double(self.fmin[0])
-        fmax = np.double(self.fmax[0])
-        iseed_1overf = int(self.iseed_1overf[0])
-        iseed_wn = int(self.iseed_wn[0])
-
-        # Generate seeds
-        seed_gain = iseed_1overf
-        seed_wn = iseed_wn
-        seed_Tn = seed_gain
-
-        if self.corr[0]:
-            seed_Tn = int(np.random.uniform() * 1.0e6)
+        return self.generate_noise_batch(
+            frequency,
+            bandwidth,
+            parameters,
+            slope,
+            samp_freq,
+            time_length,
+            dtype=dtype,
+            rng=rng,
+        )[0]
+
+    def generate_noise_batch(
+        self,
+        frequency,
+        bandwidth,
+        parameters,
+        slope,
+        samp_freq,
+        time_length,
+        n_realizations=1,
+        dtype=np.float64,
+        rng=None,
+    ):
+        """Generate ``n_realizations`` independent noise streams
+
+        The parameters have the same meaning as in :meth:`.generate_noise`,
+        and the result is a 2D array with shape ``(n_realizations,
+        n_samples)``. The 1/f components of all the realizations are
+        computed with one batched FFT, which is faster than calling
+        :meth:`.generate_noise` in a loop. The first realization is the
+        same as the one returned by :meth:`.generate_noise`; the others
+        use the subsequent seeds, or further streams spawned from ``rng``.
+        """
 
         # Calculate the number of samples
-        n_samples = time_length * samp_freq
-
-        # Check if n_samples is even or odd
-        check = np.double(n_samples) / 2.0 - n_samples / 2.0
+        n_samples = int(time_length * samp_freq)
 
         # If n_samples is odd then subtract 1 and recalculate time_length
-        if check > 0.0:
-            n_samples = n_samples - 1
+        if n_samples & 1:
+            n_samples -= 1
+
+        # FFTs are much faster if the length has only small prime factors.
+        # Half the length is rounded, so that the result stays even
+        if self.fast_length:
+            from scipy.fft import next_fast_len
+
+            n_samples = 2 * next_fast_len(n_samples // 2, real=True)
         time_length = np.double(n_samples) / samp_freq
-        n_samples = int(n_samples)
-
-        if self.total_power[0]:
-            T_signal = parameters[0]
-            T_noise = parameters[1]
-            T_signal_ant = self.tant(T_signal, freq9)
-            wn_rms = (T_signal_ant + T_noise) / np.sqrt(beta9 / samp_freq)
-            C = 2.0 * np.sqrt(np.double(self.Ns[0])) * self.A[0]
-
-            # Generate gain fluctuations
-            sqrtA = np.sqrt(2.0) * (T_signal_ant + T_noise) * C * np.sqrt(samp_freq)
-            noise_G = np.zeros(n_samples)
-            if not self.wn_only[0]:
-                noise_G = self.noise_kernel(
-                    1.0, sqrtA, samp_freq, slope, n_samples, seed_gain
-                )
-
-            # Generate noise temperature fluctuations
-            sqrtA = np.sqrt(2.0) * T_noise * self.A[0] * np.sqrt(samp_freq)
-            noise_Tn = np.zeros(n_samples)
-            if not self.wn_only[0]:
-                noise_Tn = self.noise_kernel(
-                    1, sqrtA, samp_freq, slope, n_samples, seed_Tn
-                )
+
+        # The mode is chosen once here, so that each of the two methods
+        # below only computes what its kind of receiver needs
+        if self.total_power:
+            components = self._total_power_components
         else:
-            wn_rms = parameters[0]
-            sqrtA = wn_rms * np.sqrt(samp_freq)
-            noise_G = np.zeros(n_samples)
-            noise_Tn = np.zeros(n_samples)
-            if not self.wn_only[0]:
-                noise_G = self.noise_kernel(
-                    parameters[1], sqrtA, samp_freq, slope, n_samples, seed_gain
-                )
+            components = self._differential_components
+        wn_rms, fknee, sqrtAs, offset = components(
+            frequency, bandwidth, parameters, samp_freq
+        )
+        wn_seeds, seeds = self._seeds(len(sqrtAs), n_realizations, rng)
+
         # Add white noise
-        np.random.seed(seed_wn)
-        wn = np.random.normal(0.0, wn_rms, n_samples)
-        noise_out = noise_G + noise_Tn + wn
+        noise_out = np.empty((n_realizations, n_samples), dtype=dtype)
+        for seed, cur_noise in zip(wn_seeds, noise_out):
+            np.random.default_rng(seed).standard_normal(out=cur_noise, dtype=dtype)
+        noise_out *= wn_rms
+
+        # Add 1/f noise
+        if not self.wn_only:
+            one_over_f = self._noise_kernels(
+                fknee,
+                sqrtAs * n_realizations,
+                samp_freq,
+                slope,
+                n_samples,
+                seeds,
+            )
+            for component in range(len(sqrtAs)):
+                noise_out += one_over_f[component :: len(sqrtAs)]
 
-        if self.add_offset[0]:
-            noise_out = noise_out + T_signal + T_noise
+        if self.add_offset:
+            noise_out += offset
 
         return noise_out
 
-    #########################################################
+    def _total_power_components(self, frequency, bandwidth, parameters, samp_freq):
+        """Return the white noise level, the 1/f parameters and the offset
+        of a total power stream"""
+
+        T_signal = parameters[0]
+        T_noise = parameters[1]
+
+        # Monte Carlo runs call this many times with the same parameters
+        key = (self.A, self.Ns, frequency, bandwidth, T_signal, T_noise, samp_freq)
+        if key != self._cache_key:
+            T_signal_ant = self.tant(T_signal, frequency * 1.0e9)
+            wn_rms = (T_signal_ant + T_noise) / math.sqrt(bandwidth * 1.0e9 / samp_freq)
+            C = 2.0 * math.sqrt(self.Ns) * self.A
+            sqrt_samp_freq = math.sqrt(samp_freq)
+
+            # Gain and noise temperature fluctuations share the same
+            # spectral shape, so they are generated with one batched FFT
+            sqrtAs = (
+                _SQRT2 * (T_signal_ant + T_noise) * C * sqrt_samp_freq,
+                _SQRT2 * T_noise * self.A * sqrt_samp_freq,
+            )
 
-    def noise_kernel(self, fknee, sqrtA, samp_freq, slope, n_samples, seed):
+            self._cache_key = key
+            self._cached_components = (wn_rms, sqrtAs)
 
-        import numpy as np
+        wn_rms, sqrtAs = self._cached_components
 
-        rms_wn_norm = 1.0 / np.sqrt(2.0 * n_samples)
-        creal = np.zeros(n_samples)
-        cimg = np.zeros(n_samples)
-        n_half = int(n_samples / 2.0)
+        return wn_rms, 1.0, sqrtAs, T_signal + T_noise
 
-        newknee = fknee * n_samples / samp_freq
-        new_f_min = self.fmin[0] * n_samples / samp_freq
-        new_f_max = self.fmax[0] * n_samples / samp_freq
+    def _differential_components(self, frequency, bandwidth, parameters, samp_freq):
+        """Return the white noise level, the 1/f parameters and the offset
+        of a differential stream, which has no offset"""
 
-        #       --------- spectral dependency ---------
+        wn_rms = parameters[0]
+        sqrtAs = (wn_rms * math.sqrt(samp_freq),)
 
-        sqr_spectrum = np.zeros(n_half) + 1.0
+        return wn_rms, parameters[1], sqrtAs, 0.0
 
-        indexarr = np.array(range(n_half)) + 1
-        funphi = (
-            2.0
-            / np.pi
-            * (
-                np.arctan(np.double(indexarr) / new_f_min)
-                - np.arctan(np.double(indexarr) / new_f_max)
-            )
-        )
-        sqr_spectrum = np.sqrt((newknee / indexarr * funphi) ** (-slope))
+    def _seeds(self, n_components, n_realizations, rng):
+        """Return the seeds for the white noise of each realization and the
+        seeds for their 1/f components, the latter as one flat list
 
-        #   ---------- creates fourier components --------
+        The second 1/f component (noise temperature fluctuations) uses the
+        same seed as the first one (gain fluctuations) unless ``self.corr``
+        is set.
+        """
 
-        creal[0] = 0.0
-        cimg[0] = 0.0
+        if rng is None:
+            seed_wn = int(self.iseed_wn)
+            seed_gain = int(self.iseed_1overf)
+            seed_Tn = seed_gain
+            if self.corr and n_components > 1:
+                seed_Tn = int(np.random.uniform() * 1.0e6)
+
+            wn_seeds = [seed_wn + idx for idx in range(n_realizations)]
+            seeds = [
+                seed + idx
+                for idx in range(n_realizations)
+                for seed in (seed_gain, seed_Tn)[:n_components]
+            ]
+            return wn_seeds, seeds
+
+        # SeedSequences rather than Generators are spawned, because the
+        # same seed may be needed twice when self.corr is not set
+        children = rng.bit_generator.seed_seq.spawn(3 * n_realizations)
+        wn_seeds = []
+        seeds = []
+        for idx in range(n_realizations):
+            seed_wn, seed_gain, seed_Tn = children[3 * idx : 3 * idx + 3]
+            if not self.corr:
+                seed_Tn = seed_gain
+
+            wn_seeds.append(seed_wn)
+            seeds += (seed_gain, seed_Tn)[:n_components]
+
+        return wn_seeds, seeds
 
-        np.random.seed(seed)
-        noise = np.random.normal(0.0, 1.0, n_half)
+    #########################################################
 
-        creal[1:n_half] = noise[1:n_half] * rms_wn_norm * sqr_spectrum[0 : n_half - 1]
+    def noise_kernel(self, fknee, sqrtA, samp_freq, slope, n_samples, seed):
+        return self._noise_kernels(
+            fknee, (sqrtA,), samp_freq, slope, n_samples, (seed,)
+        )[0]
 
-        noise = np.random.normal(0.0, 1.0, n_half)
-        cimg[1:n_half] = noise[1:n_half] * rms_wn_norm * sqr_spectrum[0 : n_half - 1]
+    def _noise_kernels(self, fknee, sqrtAs, samp_freq, slope, n_samples, seeds):
+        """Generate one 1/f realization for each pair in ``sqrtAs`` and ``seeds``
 
-        dr = creal[1:n_half]
-        di = cimg[1:n_half]
-        creal[n_half + 1 : n_samples] = dr[::-1]
-        cimg[n_half + 1 : n_samples] = -di[::-1]
-        creal[n_half] = (
-            np.random.normal(0.0, 1.0) * rms_wn_norm * sqr_spectrum[n_half - 1]
+        All the realizations share the same spectral shape, and they are
+        returned as the rows of a 2D array computed with one inverse FFT.
+        """
+
+        rms_wn_norm = 1.0 / np.sqrt(2.0 * n_samples)
+        n_half = int(n_samples / 2.0)
+
+        sqr_spectrum = _spectrum_shape(
+            fknee, slope, n_samples, samp_freq, self.fmin, self.fmax
         )
-        cimg[n_half] = 0.0
 
-        result = (creal + 1j * cimg) * sqrtA
+        #   ---------- creates fourier components --------
+
+        # The output is real, so only the non-negative frequencies are
+        # needed: the others are their complex conjugates, and irfft
+        # takes care of them
+        spectrum = np.empty((len(seeds), n_half + 1), dtype=np.complex128)
+
+        for row, sqrtA, seed in zip(spectrum, sqrtAs, seeds):
+            # Real and imaginary parts are interleaved in memory, so both
+            # can be drawn with one call. The Nyquist component must be real
+            rng = np.random.default_rng(seed)
+            rng.standard_normal(out=row.view(np.float64)[2 : 2 * n_half])
+            row[0] = 0.0
+            row[n_half] = rng.standard_normal()
+
+            row[1:] *= (rms_wn_norm * sqrtA) * sqr_spectrum
+
         # ;    noise_G = 2d * np.double(n_samples) / sqrt(samp_freq) * np.double(fft(result,/inverse))
-        noise = 2.0 * n_samples * np.double(np.fft.ifft(result)) / np.sqrt(samp_freq)
+        noise = (
+            2.0
+            * n_samples
+            * np.fft.irfft(spectrum, n=n_samples, axis=1)
+            / np.sqrt(samp_freq)
+        )
 
         return noise
 
@@ -245,16 +390,10 @@ class NoiseGenerator:
         May 10    first python
         """
 
-        import numpy as np
-
-        K = 1.38066e-23  # Boltzmann constant
-        h = 6.62608e-34  # Planck constant
-        K = np.double(K)
-        h = np.double(h)
-        Tthermo = np.double(Tthermo)
-        freq = np.double(freq)
-        rj1 = h * freq / K / Tthermo
-        rj2 = rj1 / (np.exp(rj1) - 1.0)
-        return Tthermo * rj2
+        rj1 = _H_OVER_K * freq / Tthermo
+
+        # expm1 avoids the cancellation in exp(rj1) - 1 when rj1 is small;
+        # this works with arrays of frequencies/temperatures too
+        return Tthermo * rj1 / np.expm1(rj1)
 
     ##################################################
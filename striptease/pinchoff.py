@@ -1,9 +1,163 @@
+import copy
+import csv
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import matplotlib
+import matplotlib.colors as mcolors
+import matplotlib.pyplot as pl
+import numpy as np
+
+import striptease
+
+# Colors used by PinchOffAnalysis.bias_plot for the Vg and Id curves
+_VG_COLORS = (
+    "#000000",  # black
+    "#0000FF",  # blue
+    "#8A2BE2",  # blueviolet
+    "#A52A2A",  # brown
+    "#DEB887",  # burlywood
+    "#5F9EA0",  # cadetblue
+    "#7FFF00",  # chartreuse
+    "#D2691E",  # chocolate
+    "#FF7F50",  # coral
+    "#6495ED",  # cornflowerblue
+    "#FFF8DC",  # cornsilk
+    "#DC143C",  # crimson
+    "#00008B",  # darkblue
+    "#008B8B",  # darkcyan
+    "#B8860B",  # darkgoldenrod
+    "#A9A9A9",  # darkgray
+    "#006400",  # darkgreen
+    "#A9A9A9",  # darkgrey
+    "#BDB76B",  # darkkhaki
+    "#8B008B",  # darkmagenta
+    "#556B2F",  # darkolivegreen
+    "#FF8C00",  # darkorange
+    "#9932CC",  # darkorchid
+    "#8B0000",  # darkred
+    "#E9967A",  # darksalmon
+    "#8FBC8F",  # darkseagreen
+    "#483D8B",  # darkslateblue
+    "#2F4F4F",  # darkslategray
+    "#2F4F4F",  # darkslategrey
+    "#00CED1",  # darkturquoise
+    "#9400D3",  # darkviolet
+    "#FF1493",  # deeppink
+    "#00BFFF",  # deepskyblue
+    "#696969",  # dimgray
+    "#696969",  # dimgrey
+    "#1E90FF",  # dodgerblue
+    "#B22222",  # firebrick
+    "#FFFAF0",  # floralwhite
+    "#228B22",  # forestgreen
+    "#FF00FF",  # fuchsia
+    "#DCDCDC",  # gainsboro
+    "#F8F8FF",  # ghostwhite
+    "#FFD700",  # gold
+    "#DAA520",  # goldenrod
+    "#008000",  # green
+    "#ADFF2F",  # greenyellow
+    "#808080",  # grey
+    "#F0FFF0",  # honeydew
+    "#FF69B4",  # hotpink
+    "#CD5C5C",  # indianred
+    "#4B0082",  # indigo
+    "#FFFFF0",  # ivory
+    "#F0E68C",  # khaki
+    "#E6E6FA",  # lavender
+    "#FFF0F5",  # lavenderblush
+    "#7CFC00",  # lawngreen
+)
+
+_ID_COLORS = tuple(
+    reversed(
+        (
+            "#FF00FF",  # magenta
+            "#800000",  # maroon
+            "#0000CD",  # mediumblue
+            "#BA55D3",  # mediumorchid
+            "#9370DB",  # mediumpurple
+            "#3CB371",  # mediumseagreen
+            "#7B68EE",  # mediumslateblue
+            "#00FA9A",  # mediumspringgreen
+            "#48D1CC",  # mediumturquoise
+            "#C71585",  # mediumvioletred
+            "#191970",  # midnightblue
+            "#F5FFFA",  # mintcream
+            "#FFE4E1",  # mistyrose
+            "#FFE4B5",  # moccasin
+            "#FFDEAD",  # navajowhite
+            "#000080",  # navy
+            "#FDF5E6",  # oldlace
+            "#808000",  # olive
+            "#6B8E23",  # olivedrab
+            "#FFA500",  # orange
+            "#FF4500",  # orangered
+            "#DA70D6",  # orchid
+            "#EEE8AA",  # palegoldenrod
+            "#98FB98",  # palegreen
+            "#AFEEEE",  # paleturquoise
+            "#DB7093",  # palevioletred
+            "#FFEFD5",  # papayawhip
+            "#FFDAB9",  # peachpuff
+            "#CD853F",  # peru
+            "#FFC0CB",  # pink
+            "#DDA0DD",  # plum
+            "#B0E0E6",  # powderblue
+            "#800080",  # purple
+            "#663399",  # rebeccapurple
+            "#FF0000",  # red
+            "#BC8F8F",  # rosybrown
+            "#4169E1",  # royalblue
+            "#8B4513",  # saddlebrown
+            "#FA8072",  # salmon
+            "#F4A460",  # sandybrown
+            "#2E8B57",  # seagreen
+            "#FFF5EE",  # seashell
+            "#A0522D",  # sienna
+            "#C0C0C0",  # silver
+            "#87CEEB",  # skyblue
+            "#6A5ACD",  # slateblue
+            "#00FF7F",  # springgreen
+            "#4682B4",  # steelblue
+            "#D2B48C",  # tan
+            "#008080",  # teal
+            "#D8BFD8",  # thistle
+            "#FF6347",  # tomato
+            "#40E0D0",  # turquoise
+            "#EE82EE",  # violet
+            "#F5DEB3",  # wheat
+            "#9ACD32",  # yellowgreen
+        )
+    )
+)
+
+
+def _call_plot(plotter, name, args):
+    # Run in the worker processes of PinchOffAnalysis._run_plots
+    getattr(plotter, name)(*args)
+
+
 class PinchOffAnalysis:
     def __init__(self, data, output_folder="./"):
         data.read_file_metadata()
         self.data = data
-        self.tags = data.tags
+        # "data.tags" is read-only, but add_tag needs to append to the list
+        self.tags = list(data.tags)
+        # Cache of the tags found by get_times, indexed by the name searched
+        self._tag_cache = {}
+        # Caches of the results of get_subtags and get_tested_polarimeters
+        self._subtag_cache = {}
+        self._tested_pols_cache = {}
+        # Timelines already loaded by get_hk and get_sci. The public methods
+        # drop them (see _release_timelines) once a polarimeter is done
+        self._hk_cache = {}
+        self._sci_cache = {}
         self.amps = ["H%s%s" % (l, n) for l in ["A", "B"] for n in ["1", "2", "3"]]
+        # Layout of the amplifiers in the plots: one row per leg
+        self._amps_2x3 = np.reshape(self.amps, (2, 3))
         self.verification_tags = self.get_subtags(
             "PINCHOFF_VERIFICATION_1"
         ) + self.get_subtags("PINCHOFF_IDSET")
@@ -25,12 +179,49 @@ class PinchOffAnalysis:
             "3": "HB2",
             "5": "HB3",
         }
-        self.quad = lambda x, a, b, c: a * x ** 2 + b * x + c
-        self.lin = lambda x, a, b: a * x + b
 
     #        self.verification_tags = ['STABLE_ACQUISITION_%s' % p for p in self.get_tested_polarimeters()] + \
     #        ['PINCHOFF_IDSET_%s_%s' % (p,a) for p in self.get_tested_polarimeters() for a in self.amps]
 
+    @staticmethod
+    def quad(x, a, b, c):
+        return (a * x + b) * x + c
+
+    @staticmethod
+    def lin(x, a, b):
+        return a * x + b
+
+    ###################################
+    # Save plots, possibly in parallel
+    ###################################
+    def _run_plots(self, function, calls, max_workers):
+        """
+        Call "function" (one of the *_single methods) once for every tuple of
+        arguments in "calls". If max_workers is not 1, the calls are spread
+        over a pool of processes (None means one process per CPU)
+        """
+        if max_workers == 1:
+            for args in calls:
+                function(*args)
+            return
+
+        # Worker processes only save files: they do not need the HDF5 file nor
+        # the cached timelines, and they can use the non-interactive backend
+        # without changing the one chosen by the caller
+        plotter = copy.copy(self)
+        for name in ("data", "_hk_cache", "_sci_cache"):
+            delattr(plotter, name)
+
+        with ProcessPoolExecutor(
+            max_workers=max_workers, initializer=matplotlib.use, initargs=("Agg",)
+        ) as executor:
+            futures = [
+                executor.submit(_call_plot, plotter, function.__name__, args)
+                for args in calls
+            ]
+            for future in futures:
+                future.result()
+
     ##########################
     # Add a tag
     ##########################
@@ -39,7 +230,6 @@ class PinchOffAnalysis:
         This function add a tag into self.tags. THE FILE IS NOT MODIFIED, so any modification is
         lost when the instance is destroyed
         """
-        import striptease
 
         last_id = self.tags[-1].id
         newtag = striptease.hdf5files.Tag(
@@ -48,6 +238,9 @@ class PinchOffAnalysis:
 
         # append tag
         self.tags.append(newtag)
+        self._tag_cache.clear()
+        self._subtag_cache.clear()
+        self._tested_pols_cache.clear()
         self.verification_tags = self.get_subtags(
             "PINCHOFF_VERIFICATION_1"
         ) + self.get_subtags("PINCHOFF_IDSET")
@@ -62,10 +255,15 @@ class PinchOffAnalysis:
         polarimeter in a given module
         """
         curname = "%s%s" % (tag, polarimeter)
-        curtag = [t for t in self.tags if (t.name in curname)]
         try:
-            curtag = curtag[0]
-        except IndexError:
+            curtag = self._tag_cache[curname]
+        except KeyError:
+            # Tag names can be substrings of "curname", so a plain dict
+            # lookup is not enough: scan the list only once per name
+            curtag = next((t for t in self.tags if t.name in curname), None)
+            self._tag_cache[curname] = curtag
+
+        if curtag is None:
             print("Polarimeter %s is not present in data" % polarimeter)
             return None, None
 
@@ -81,11 +279,15 @@ class PinchOffAnalysis:
         This functions extracts HK data given a certain time interval
         """
 
-        time_obj, values = self.data.load_hk(group, subgroup, parameter)
-        mjd = time_obj.mjd  # Convert to Julian date
-        mask = (mjd >= tstart) & (mjd <= tend)
+        key = (group, subgroup, parameter)
+        try:
+            timeline = self._hk_cache[key]
+        except KeyError:
+            time_obj, values = self.data.load_hk(group, subgroup, parameter)
+            timeline = (time_obj.unix, values)
+            self._hk_cache[key] = timeline
 
-        return time_obj[mask].unix, values[mask]
+        return self._time_window(*timeline, tstart, tend)
 
     ##################################
     # Get SCI in a given time interval
@@ -95,57 +297,265 @@ class PinchOffAnalysis:
         This function extract scientific data from a polarimeter
         given a certain time interval
         """
-        time_obj, values = self.data.load_sci(polarimeter, data_type, detector)
-        mjd = time_obj.mjd  # Convert to Julian date
-        mask = (mjd >= tstart) & (mjd <= tend)
+        t, values = self.get_sci_batch(
+            polarimeter, [data_type], [detector], tstart, tend
+        )
+        return t, values[(data_type, detector)]
+
+    def get_sci_batch(self, polarimeter, data_types, detectors, tstart, tend):
+        """
+        This function extracts the scientific data of several detectors of a
+        polarimeter in a given time interval. The whole scientific table of the
+        polarimeter (all data types and detectors) is read once and cached, and
+        the time interval is searched only once, as all the columns share the
+        same times. It returns the times and a dictionary associating each
+        (data_type, detector) pair with its values
+        """
+        if len(data_types) == 0:
+            return np.empty(0), {}
 
-        return time_obj[mask].unix, values[mask]
+        try:
+            unix, columns = self._sci_cache[polarimeter]
+        except KeyError:
+            time_obj, columns = self.data.load_sci(
+                polarimeter,
+                sorted(striptease.hdf5files.VALID_DATA_TYPES),
+                as_soa=True,
+            )
+            unix = time_obj.unix
+            self._sci_cache[polarimeter] = (unix, columns)
+
+        lo, hi = self._window_bounds(unix, tstart, tend)
+
+        # Copies do not keep the cached columns alive after
+        # _release_timelines has dropped them
+        result = {}
+        for data_type in data_types:
+            for detector in detectors:
+                column = columns["%s%s" % (data_type.upper(), detector.upper())]
+                result[(data_type, detector)] = column[lo:hi].copy()
+
+        return unix[lo:hi].copy(), result
+
+    def _time_window(self, unix, values, tstart, tend):
+        """
+        Return the Unix times and the values whose MJD is within [tstart, tend].
+        They are copies, so that they do not keep the whole timelines alive
+        once _release_timelines has dropped them
+        """
+
+        lo, hi = self._window_bounds(unix, tstart, tend)
+        return unix[lo:hi].copy(), values[lo:hi].copy()
+
+    def _release_timelines(self, polarimeter):
+        """
+        Remove the timelines of a polarimeter from the caches of get_hk and
+        get_sci_batch
+        """
+
+        suffix = "_" + polarimeter
+        for key in [x for x in self._hk_cache if x[1].endswith(suffix)]:
+            del self._hk_cache[key]
+
+        self._sci_cache.pop(polarimeter, None)
+
+    def _window_bounds(self, unix, tstart, tend):
+        """
+        Return the range of indexes of the Unix times whose MJD is within
+        [tstart, tend]. Times are sorted, so the extrema are found by
+        bisection. Only the two extrema are converted to Unix times, not the
+        whole timeline
+        """
+
+        epoch = striptease.hdf5files.UNIX_EPOCH_MJD
+        lo = np.searchsorted(unix, (tstart - epoch) * 86400.0, side="left")
+        hi = np.searchsorted(unix, (tend - epoch) * 86400.0, side="right")
+        return lo, hi
 
     ##################################
     # Calculate r^2
     ##################################
     def rsquare(self, xvalues, yvalues, parameters, function):
-        import numpy as np
+        """
+        Return the coefficient of determination of the fit "parameters" (as
+        returned by scipy.optimize.curve_fit) of the model "function"
+        """
+        return self._rsquare(yvalues, function(xvalues, *parameters[0]))
 
-        residuals = yvalues - function(xvalues, *parameters[0])
-        ss_res = np.sum(residuals ** 2)
-        ss_tot = np.sum((yvalues - np.mean(yvalues)) ** 2)
-        return 1.0 - (ss_res / ss_tot)
+    def _rsquare(self, yvalues, predictions):
+        """
+        Return the coefficient of determination of a fit, given the measured
+        values and the values predicted by the model
+        """
+        residuals = yvalues - predictions
+        deviations = yvalues - yvalues.mean()
+        return 1.0 - (residuals @ residuals) / (deviations @ deviations)
+
+    ###########################################
+    # Calculate the mean of a list of arrays
+    ###########################################
+    def _segment_means(self, segments):
+        """
+        Return the mean of each array in "segments" (NaN for empty arrays),
+        using one ufunc call on their concatenation
+        """
+
+        lengths = np.array([len(x) for x in segments], dtype=int)
+        means = np.full(len(segments), np.nan)
+        nonempty = lengths > 0
+        if np.any(nonempty):
+            offsets = np.cumsum(lengths) - lengths
+            sums = np.add.reduceat(
+                np.concatenate(segments), offsets[nonempty], dtype=np.float64
+            )
+            means[nonempty] = sums / lengths[nonempty]
+
+        return means
+
+    def _unique_in_order(self, values):
+        """
+        Return the distinct elements of the array "values", in the order in
+        which they first appear (np.unique alone would sort them, and
+        currents are strings: "100" would come before "20")
+        """
+
+        _, first = np.unique(values, return_index=True)
+        return values[np.sort(first)]
+
+    def _gapless_times(self, segments):
+        """
+        Return a fake time vector for each array in the 2x3 nested list
+        "segments", so that consecutive arrays follow each other without
+        gaps. The sample indexes are produced by a single call to
+        np.arange and then split among the arrays
+        """
+
+        lengths = [
+            len(x) for row in [0, 1] for col in [0, 1, 2] for x in segments[row][col]
+        ]
+        chunks = iter(np.split(np.arange(sum(lengths)), np.cumsum(lengths)[:-1]))
+        return [
+            [[next(chunks) for _ in segments[row][col]] for col in [0, 1, 2]]
+            for row in [0, 1]
+        ]
+
+    ##################################
+    # Fit a polynomial
+    ##################################
+    def _fit_polynomial(self, xvalues, yvalues, degree):
+        """
+        Least-squares fit of a polynomial of the given degree, which is
+        linear in its coefficients and therefore needs no iterative solver.
+        It returns ((coefficients, covariance), r^2), where the first element
+        has the same layout as the result of scipy.optimize.curve_fit
+        """
+
+        if not (np.all(np.isfinite(xvalues)) and np.all(np.isfinite(yvalues))):
+            raise ValueError("Data to fit contain NaNs or infinite values")
+
+        num_of_params = degree + 1
+        if len(xvalues) < num_of_params:
+            raise ValueError(
+                "Not enough points (%d) to fit %d parameters"
+                % (len(xvalues), num_of_params)
+            )
+
+        matrix = np.vander(xvalues, num_of_params)
+        coeffs, _, _, _ = np.linalg.lstsq(matrix, yvalues, rcond=None)
+
+        predictions = matrix @ coeffs
+
+        # Same covariance estimate as curve_fit: it is computed from the SVD
+        # of the design matrix, as inverting matrix.T @ matrix would square
+        # its (large) condition number
+        dof = len(xvalues) - num_of_params
+        if dof > 0:
+            residuals = yvalues - predictions
+            _, sing, vt = np.linalg.svd(matrix, full_matrices=False)
+            keep = sing > np.finfo(float).eps * max(matrix.shape) * sing[0]
+            sing = sing[keep]
+            vt = vt[keep]
+            cov = (vt.T / (sing * sing)) @ vt * (residuals @ residuals / dof)
+        else:
+            cov = np.full((num_of_params, num_of_params), np.inf)
+
+        return (coeffs, cov), self._rsquare(yvalues, predictions)
+
+    def _save_fits_npz(self, filename, output):
+        """
+        Save the fits returned by plot_IV into a compressed NumPy .npz file.
+        The fit results of polarimeter output["polarimeters"][i] and
+        amplifier amps[row, col] are stored in the arrays "params_quad",
+        "cov_quad", "rsq_quad", "params_lin", "cov_lin", and "rsq_lin" at
+        index [i, row, col]. Failed fits are saved as NaNs
+        """
+
+        amps = self._amps_2x3
+        pols = list(output.keys())
+        arrays = {"polarimeters": np.array(pols), "amps": amps}
+
+        for name, key, num_of_params in (
+            ("quad", "quadratic", 3),
+            ("lin", "linear", 2),
+        ):
+            params = np.full((len(pols), 2, 3, num_of_params), np.nan)
+            cov = np.full((len(pols), 2, 3, num_of_params, num_of_params), np.nan)
+            rsq = np.full((len(pols), 2, 3), np.nan)
+
+            for pol_idx, pol in enumerate(pols):
+                for row in [0, 1]:
+                    for col in [0, 1, 2]:
+                        fit, cur_rsq = output[pol][amps[row, col]][key]
+                        if fit is not None:
+                            params[pol_idx, row, col], cov[pol_idx, row, col] = fit
+                            rsq[pol_idx, row, col] = cur_rsq
+
+            arrays["params_" + name] = params
+            arrays["cov_" + name] = cov
+            arrays["rsq_" + name] = rsq
+
+        np.savez_compressed(filename, **arrays)
 
     #########################################
     # Plot IV curves
     #########################################
-    def plot_IV(self, polarimeters="All", filename=None, image="png"):
-        import striptease
-        import pylab as pl
-        import numpy as np
-        from scipy.optimize import curve_fit
-        import pickle
-        from datetime import datetime
-        import numpy as np
-
+    def plot_IV(
+        self,
+        polarimeters="All",
+        filename=None,
+        image="png",
+        max_workers=1,
+        output_format="pickle",
+    ):
         """
-        This function plots IV curves given a certain configuration stored into self.configuration. 
-        If self.configuration is empty the function first extracts the configuration for all tested 
+        This function plots IV curves given a certain configuration stored into self.configuration.
+        If self.configuration is empty the function first extracts the configuration for all tested
         polarimeters
-        
+
         It also fits the IV curves with quadratic and linear functions
-        
+
         Inputs
-        polarimeters  STRING or LIST of strings. If polarimeters = 'All' (default)  then all the 
-                                                 polarimeter are tested. Otherwise it contains a 
-                                                 list of strings identifying the polarimeters to 
+        polarimeters  STRING or LIST of strings. If polarimeters = 'All' (default)  then all the
+                                                 polarimeter are tested. Otherwise it contains a
+                                                 list of strings identifying the polarimeters to
                                                  be tested
-                                                 
 
-        filename      STRING  The filename where to save the output dictionary in a pickle file
+
+        filename      STRING  The filename where to save the output dictionary
                               It defaults to None. In this case the filename is generated automatically
 
         image         STRING  The format of the saved plots ('png' (Default), 'pdf', 'svg')
-        
+
+        max_workers   INT     Number of processes used to save the plots. It defaults to 1;
+                              None uses one process per CPU
+
+        output_format STRING  Either 'pickle' (default), which saves the output dictionary as it
+                              is, or 'npz', which saves the fit results as NumPy arrays in a
+                              compressed .npz file
+
         Output
         output   DICT   a dictionary containing the results of the linear and quadradic fits
-        
+
         """
         if len(self.configuration) == 0:
             print("Generating instrument configuration")
@@ -157,22 +567,21 @@ class PinchOffAnalysis:
         if polarimeters == "All":
             polarimeters = self.get_tested_polarimeters(tags=main_tags)
 
-        amps = np.reshape(self.amps, (2, 3))
+        amps = self._amps_2x3
 
         output = {}
+        plot_calls = []
 
         for pol in polarimeters:
             # Initialize matrices
-            vgate = [[j for j in [1, 2, 3]] for i in [0, 1]]
-            idrain = [[j for j in [1, 2, 3]] for i in [0, 1]]
-            fitquad = [[j for j in [1, 2, 3]] for i in [0, 1]]
-            fitlin = [[j for j in [1, 2, 3]] for i in [0, 1]]
-            rsquared = [[j for j in [1, 2, 3]] for i in [0, 1]]
-            rsquared2 = [[j for j in [1, 2, 3]] for i in [0, 1]]
-            highlight = [
-                [[j for j in [1, 2, 3]] for i in [0, 1]],
-                [[j for j in [1, 2, 3]] for i in [0, 1]],
-            ]
+            vgate = np.empty((2, 3), dtype=object)
+            idrain = np.empty((2, 3), dtype=object)
+            fitquad = np.empty((2, 3), dtype=object)
+            fitlin = np.empty((2, 3), dtype=object)
+            rsquared = np.empty((2, 3), dtype=object)
+            rsquared2 = np.empty((2, 3), dtype=object)
+            highlight_idx = np.empty((2, 3), dtype=object)
+            highlight_lbl = np.empty((2, 3), dtype=object)
 
             output[pol] = {}
 
@@ -182,7 +591,7 @@ class PinchOffAnalysis:
                     currents = self.get_currents(pol, amps[row, col])
 
                     # Remove repeats
-                    currents = list(dict.fromkeys(currents))
+                    currents = self._unique_in_order(currents)
 
                     # Get measured Voltage and current values
                     dumv = []
@@ -204,6 +613,8 @@ class PinchOffAnalysis:
 
                     #                    print(pol, amps[row,col], amp_id, vg_value,id_value)
 
+                    vg_segments = []
+                    id_segments = []
                     for current in currents:
                         curtag = "PINCHOFF_IDSET_%s_%s_%smuA" % (
                             pol,
@@ -231,70 +642,93 @@ class PinchOffAnalysis:
                             group, subgroup, cur_hk, tstart, tend
                         )
 
-                        dumv.append(np.mean(vg_values))
-                        dumi.append(np.mean(id_values))
+                        vg_segments.append(vg_values)
+                        id_segments.append(id_values)
+
+                    # Average the samples acquired for each current at once
+                    dumv.extend(self._segment_means(vg_segments))
+                    dumi.extend(self._segment_means(id_segments))
 
                     # Sort values according to Vgate
                     dumi = np.array(dumi)
                     dumv = np.array(dumv)
 
-                    dumi = dumi[np.argsort(dumv)]
-                    dumv = np.sort(dumv)
+                    order = np.argsort(dumv, kind="stable")
+                    dumi = dumi[order]
+                    dumv = dumv[order]
 
-                    vgate[row][col] = dumv
-                    idrain[row][col] = dumi
+                    vgate[row, col] = dumv
+                    idrain[row, col] = dumi
 
                     # Fit curve
                     try:
-                        fitquad[row][col] = curve_fit(self.quad, dumv, dumi)
-                        rsquared2[row][col] = self.rsquare(
-                            dumv, dumi, fitquad[row][col], self.quad
+                        fitquad[row, col], rsquared2[row, col] = self._fit_polynomial(
+                            dumv, dumi, 2
                         )
                     except:
-                        fitquad[row][col] = None
-                        rsquared2[row][col] = None
+                        fitquad[row, col] = None
+                        rsquared2[row, col] = None
 
                     try:
-                        fitlin[row][col] = curve_fit(self.lin, dumv, dumi)
-                        rsquared[row][col] = self.rsquare(
-                            dumv, dumi, fitlin[row][col], self.lin
+                        fitlin[row, col], rsquared[row, col] = self._fit_polynomial(
+                            dumv, dumi, 1
                         )
                     except:
-                        fitlin[row][col] = None
-                        rsquared[row][col] = None
-
-                    highlight[0][row][col] = np.where(dumv == vstart)[0]
-                    highlight[1][row][col] = "Stable acquisition before pinchoff"
+                        fitlin[row, col] = None
+                        rsquared[row, col] = None
+
+                    # "dumv" is sorted, so the points equal to vstart are
+                    # found by binary search
+                    highlight_idx[row, col] = np.arange(
+                        np.searchsorted(dumv, vstart, side="left"),
+                        np.searchsorted(dumv, vstart, side="right"),
+                    )
+                    highlight_lbl[row, col] = "Stable acquisition before pinchoff"
 
                     output[pol][amps[row, col]] = {}
                     output[pol][amps[row, col]]["quadratic"] = (
-                        fitquad[row][col],
-                        rsquared2[row][col],
+                        fitquad[row, col],
+                        rsquared2[row, col],
                     )
                     output[pol][amps[row, col]]["linear"] = (
-                        fitlin[row][col],
-                        rsquared[row][col],
+                        fitlin[row, col],
+                        rsquared[row, col],
                     )
 
-            self.plot_IV_single(
-                pol,
-                vgate,
-                idrain,
-                fitquad,
-                fitlin,
-                rsquared2,
-                rsquared,
-                highlight,
-                image,
+            plot_calls.append(
+                (
+                    pol,
+                    vgate,
+                    idrain,
+                    fitquad,
+                    fitlin,
+                    rsquared2,
+                    rsquared,
+                    (highlight_idx, highlight_lbl),
+                    image,
+                )
             )
+            self._release_timelines(pol)
+
+        self._run_plots(self.plot_IV_single, plot_calls, max_workers)
+
+        if output_format not in ("pickle", "npz"):
+            raise ValueError("Unknown output format '%s'" % output_format)
 
         if filename == None:
             now = str(datetime.now())
-            filename = self.output_folder + "strip_pinchoff_analysis_" + now + ".pickle"
+            filename = "%sstrip_pinchoff_analysis_%s.%s" % (
+                self.output_folder,
+                now,
+                output_format,
+            )
 
-        file_id = open(filename, "wb")
-        pickle.dump(output, file_id)
-        file_id.close()
+        if output_format == "npz":
+            self._save_fits_npz(filename, output)
+        else:
+            file_id = open(filename, "wb")
+            pickle.dump(output, file_id)
+            file_id.close()
 
         return output
 
@@ -303,16 +737,9 @@ class PinchOffAnalysis:
     def plot_IV_single(
         self, polarimeter, V, I, fitquad, fitlin, rq, rlin, highlight, image
     ):
-        import matplotlib
-
-        matplotlib.use("Agg")
-        import matplotlib.pyplot as pl
-        import matplotlib.colors as mcolors
-        import numpy as np
-
         """
         This function makes a IV plot for a single polarimeter
-        
+
         Inputs
         polarimeter STRING      the id of the polarimeter
         V           FLOAT ARRAY an array of floats containing the voltage values
@@ -324,13 +751,13 @@ class PinchOffAnalysis:
         highlight   MIXED       indicates if one or more points need be highlighted
                                 with a different color. In this case highlight contains
                                 two 2x3 lists: the first one is the list of indices of the points
-                                to be highlighted, the second one is a list of descriptions 
+                                to be highlighted, the second one is a list of descriptions
                                 appearing in a legend
         image       STRING      Image format for the plots ('png', 'svg', 'pdf')
         """
         colors = list(mcolors.CSS4_COLORS.values())
 
-        amps = np.reshape(self.amps, (2, 3))
+        amps = self._amps_2x3
         fig, axes = pl.subplots(2, 3, figsize=(20, 20))
         plot_title = "Polarimeter " + polarimeter
         fig.suptitle(plot_title)
@@ -341,7 +768,7 @@ class PinchOffAnalysis:
                 axes[row, col].plot(
                     V[row][col], I[row][col], "o", markersize=10, label="PINCHOFF TEST"
                 )
-                xarr = np.linspace(min(V[row][col]), max(V[row][col]), 100)
+                xarr = np.linspace(np.nanmin(V[row][col]), np.nanmax(V[row][col]), 50)
 
                 # Plot fits
                 if fitquad[row][col] is not None:
@@ -376,22 +803,27 @@ class PinchOffAnalysis:
                 if highlight != False:
                     indices = highlight[0][row][col]
                     labels = highlight[1][row][col]
-                    j = -1
-                    for index in indices:
-                        j = j + 1
-                        if type(labels) == str:
-                            lab = labels
-                        else:
-                            lab = labels[j]
-
-                        axes[row, col].plot(
-                            V[row][col][index],
-                            I[row][col][index],
-                            "o",
-                            markersize=10,
-                            color=colors[20 + j],
-                            label=lab,
-                        )
+                    if type(labels) == str:
+                        # All the points share the same label, so they can
+                        # be drawn by one call with one legend entry
+                        if len(indices) > 0:
+                            axes[row, col].scatter(
+                                V[row][col][indices],
+                                I[row][col][indices],
+                                s=100,
+                                c=colors[20 : 20 + len(indices)],
+                                label=labels,
+                            )
+                    else:
+                        for j, index in enumerate(indices):
+                            axes[row, col].plot(
+                                V[row][col][index],
+                                I[row][col][index],
+                                "o",
+                                markersize=10,
+                                color=colors[20 + j],
+                                label=labels[j],
+                            )
 
                 title = "Amplifier " + amps[row, col]
                 axes[row, col].set_title(title)
@@ -405,149 +837,24 @@ class PinchOffAnalysis:
     # Plot Vg and Id curves versus time #####
     #########################################
 
-    def bias_plot(self, polarimeters="All", image="png"):
-        import striptease
-        import pylab as pl
-        import numpy as np
-        from scipy.optimize import curve_fit
-        import pickle
-        from datetime import datetime
-        import matplotlib.colors as mcolors
-
+    def bias_plot(self, polarimeters="All", image="png", max_workers=1):
         """
-        This function plots Vg and Id versus time given a certain configuration stored into self.configuration. 
-        If self.configuration is empty the function first extracts the configuration for all tested 
+        This function plots Vg and Id versus time given a certain configuration stored into self.configuration.
+        If self.configuration is empty the function first extracts the configuration for all tested
         polarimeters
-        
+
         Inputs
         polarimeters LIST of STRING values  List of polarimeters to plot ('All' plots all polarimeters)
         image        STRING         the format of the output plot ('svg, 'png', 'pdf')
-        
+        max_workers  INT            number of processes used to save the plots (default 1;
+                                    None uses one process per CPU)
+
         Output
         None (plots are saved as pdf files)
-        
-        """
-        vg_col = {
-            "black": "#000000",
-            "blue": "#0000FF",
-            "blueviolet": "#8A2BE2",
-            "brown": "#A52A2A",
-            "burlywood": "#DEB887",
-            "cadetblue": "#5F9EA0",
-            "chartreuse": "#7FFF00",
-            "chocolate": "#D2691E",
-            "coral": "#FF7F50",
-            "cornflowerblue": "#6495ED",
-            "cornsilk": "#FFF8DC",
-            "crimson": "#DC143C",
-            "darkblue": "#00008B",
-            "darkcyan": "#008B8B",
-            "darkgoldenrod": "#B8860B",
-            "darkgray": "#A9A9A9",
-            "darkgreen": "#006400",
-            "darkgrey": "#A9A9A9",
-            "darkkhaki": "#BDB76B",
-            "darkmagenta": "#8B008B",
-            "darkolivegreen": "#556B2F",
-            "darkorange": "#FF8C00",
-            "darkorchid": "#9932CC",
-            "darkred": "#8B0000",
-            "darksalmon": "#E9967A",
-            "darkseagreen": "#8FBC8F",
-            "darkslateblue": "#483D8B",
-            "darkslategray": "#2F4F4F",
-            "darkslategrey": "#2F4F4F",
-            "darkturquoise": "#00CED1",
-            "darkviolet": "#9400D3",
-            "deeppink": "#FF1493",
-            "deepskyblue": "#00BFFF",
-            "dimgray": "#696969",
-            "dimgrey": "#696969",
-            "dodgerblue": "#1E90FF",
-            "firebrick": "#B22222",
-            "floralwhite": "#FFFAF0",
-            "forestgreen": "#228B22",
-            "fuchsia": "#FF00FF",
-            "gainsboro": "#DCDCDC",
-            "ghostwhite": "#F8F8FF",
-            "gold": "#FFD700",
-            "goldenrod": "#DAA520",
-            "green": "#008000",
-            "greenyellow": "#ADFF2F",
-            "grey": "#808080",
-            "honeydew": "#F0FFF0",
-            "hotpink": "#FF69B4",
-            "indianred": "#CD5C5C",
-            "indigo": "#4B0082",
-            "ivory": "#FFFFF0",
-            "khaki": "#F0E68C",
-            "lavender": "#E6E6FA",
-            "lavenderblush": "#FFF0F5",
-            "lawngreen": "#7CFC00",
-        }
-
-        id_col = {
-            "magenta": "#FF00FF",
-            "maroon": "#800000",
-            "mediumblue": "#0000CD",
-            "mediumorchid": "#BA55D3",
-            "mediumpurple": "#9370DB",
-            "mediumseagreen": "#3CB371",
-            "mediumslateblue": "#7B68EE",
-            "mediumspringgreen": "#00FA9A",
-            "mediumturquoise": "#48D1CC",
-            "mediumvioletred": "#C71585",
-            "midnightblue": "#191970",
-            "mintcream": "#F5FFFA",
-            "mistyrose": "#FFE4E1",
-            "moccasin": "#FFE4B5",
-            "navajowhite": "#FFDEAD",
-            "navy": "#000080",
-            "oldlace": "#FDF5E6",
-            "olive": "#808000",
-            "olivedrab": "#6B8E23",
-            "orange": "#FFA500",
-            "orangered": "#FF4500",
-            "orchid": "#DA70D6",
-            "palegoldenrod": "#EEE8AA",
-            "palegreen": "#98FB98",
-            "paleturquoise": "#AFEEEE",
-            "palevioletred": "#DB7093",
-            "papayawhip": "#FFEFD5",
-            "peachpuff": "#FFDAB9",
-            "peru": "#CD853F",
-            "pink": "#FFC0CB",
-            "plum": "#DDA0DD",
-            "powderblue": "#B0E0E6",
-            "purple": "#800080",
-            "rebeccapurple": "#663399",
-            "red": "#FF0000",
-            "rosybrown": "#BC8F8F",
-            "royalblue": "#4169E1",
-            "saddlebrown": "#8B4513",
-            "salmon": "#FA8072",
-            "sandybrown": "#F4A460",
-            "seagreen": "#2E8B57",
-            "seashell": "#FFF5EE",
-            "sienna": "#A0522D",
-            "silver": "#C0C0C0",
-            "skyblue": "#87CEEB",
-            "slateblue": "#6A5ACD",
-            "springgreen": "#00FF7F",
-            "steelblue": "#4682B4",
-            "tan": "#D2B48C",
-            "teal": "#008080",
-            "thistle": "#D8BFD8",
-            "tomato": "#FF6347",
-            "turquoise": "#40E0D0",
-            "violet": "#EE82EE",
-            "wheat": "#F5DEB3",
-            "yellowgreen": "#9ACD32",
-        }
 
-        vg_colors = list(vg_col.values())
-        id_colors = list(id_col.values())
-        id_colors = list(reversed(id_colors))
+        """
+        vg_colors = _VG_COLORS
+        id_colors = _ID_COLORS
 
         if len(self.configuration) == 0:
             print("Generating instrument configuration")
@@ -560,17 +867,18 @@ class PinchOffAnalysis:
         if polarimeters == "All":
             polarimeters = self.get_tested_polarimeters(tags=main_tags)
 
-        amps = np.reshape(self.amps, (2, 3))
+        amps = self._amps_2x3
 
         output = {}
+        plot_calls = []
 
         for pol in polarimeters:
 
             # Initialize matrices
-            vgate = [[j for j in [1, 2, 3]] for i in [0, 1]]
-            idrain = [[j for j in [1, 2, 3]] for i in [0, 1]]
-            timev = [[j for j in [1, 2, 3]] for i in [0, 1]]
-            timei = [[j for j in [1, 2, 3]] for i in [0, 1]]
+            vgate = np.empty((2, 3), dtype=object)
+            idrain = np.empty((2, 3), dtype=object)
+            timev = np.empty((2, 3), dtype=object)
+            timei = np.empty((2, 3), dtype=object)
 
             for row in [0, 1]:
                 for col in [0, 1, 2]:
@@ -590,6 +898,18 @@ class PinchOffAnalysis:
 
                     cur_vghk = "VG%s_HK" % (str(amp_id))
                     cur_idhk = "ID%s_HK" % (str(amp_id))
+
+                    # The HK streams are the same for all the currents: only
+                    # the time window changes, and get_hk keeps them cached
+                    group_vg, subgroup_vg = striptease.hdf5files.get_group_subgroup(
+                        cur_vghk
+                    )
+                    subgroup_vg = "%s_%s" % (subgroup_vg, pol)
+                    group_id, subgroup_id = striptease.hdf5files.get_group_subgroup(
+                        cur_idhk
+                    )
+                    subgroup_id = "%s_%s" % (subgroup_id, pol)
+
                     cur_tag = "PINCHOFF_VERIFICATION_1"
                     tags = []
                     col_id = 0
@@ -605,20 +925,16 @@ class PinchOffAnalysis:
                         tstart, tend = self.get_times(pol, cur_tag)
 
                         # VG data
-                        group, subgroup = striptease.hdf5files.get_group_subgroup(
-                            cur_vghk
+                        t, values = self.get_hk(
+                            group_vg, subgroup_vg, cur_vghk, tstart, tend
                         )
-                        subgroup = "%s_%s" % (subgroup, pol)
-                        t, values = self.get_hk(group, subgroup, cur_vghk, tstart, tend)
                         dumv.append(values[-10:])
                         dumvt.append(t[-10:])
 
                         # ID data
-                        group, subgroup = striptease.hdf5files.get_group_subgroup(
-                            cur_idhk
+                        t, values = self.get_hk(
+                            group_id, subgroup_id, cur_idhk, tstart, tend
                         )
-                        subgroup = "%s_%s" % (subgroup, pol)
-                        t, values = self.get_hk(group, subgroup, cur_idhk, tstart, tend)
                         dumi.append(values[-10:])
                         dumit.append(t[-10:])
 
@@ -635,20 +951,16 @@ class PinchOffAnalysis:
                         tstart, tend = self.get_times(pol, curtag)
 
                         # VG data
-                        group, subgroup = striptease.hdf5files.get_group_subgroup(
-                            cur_vghk
+                        t, values = self.get_hk(
+                            group_vg, subgroup_vg, cur_vghk, tstart, tend
                         )
-                        subgroup = "%s_%s" % (subgroup, pol)
-                        t, values = self.get_hk(group, subgroup, cur_vghk, tstart, tend)
                         dumv.append(values)
                         dumvt.append(t)
 
                         # ID data
-                        group, subgroup = striptease.hdf5files.get_group_subgroup(
-                            cur_idhk
+                        t, values = self.get_hk(
+                            group_id, subgroup_id, cur_idhk, tstart, tend
                         )
-                        subgroup = "%s_%s" % (subgroup, pol)
-                        t, values = self.get_hk(group, subgroup, cur_idhk, tstart, tend)
                         dumi.append(values)
                         dumit.append(t)
 
@@ -659,14 +971,17 @@ class PinchOffAnalysis:
                     #                    dumi = dumi[np.argsort(dumv)]
                     #                    dumv = np.sort(dumv)
 
-                    vgate[row][col] = dumv
-                    idrain[row][col] = dumi
-                    timev[row][col] = dumvt
-                    timei[row][col] = dumit
+                    vgate[row, col] = dumv
+                    idrain[row, col] = dumi
+                    timev[row, col] = dumvt
+                    timei[row, col] = dumit
 
-            self.bias_plot_single(
-                pol, (timev, vgate), (timei, idrain), tags, vg_col, id_col, image=image
+            plot_calls.append(
+                (pol, (timev, vgate), (timei, idrain), tags, vg_col, id_col, image)
             )
+            self._release_timelines(pol)
+
+        self._run_plots(self.bias_plot_single, plot_calls, max_workers)
 
     #        if filename == None:
     #            now = str(datetime.now())
@@ -681,16 +996,9 @@ class PinchOffAnalysis:
     def bias_plot_single(
         self, polarimeter, vgate, idrain, tags, vg_col, id_col, image="png"
     ):
-        import matplotlib
-
-        matplotlib.use("Agg")
-        import matplotlib.pyplot as pl
-        import matplotlib.colors as mcolors
-        import numpy as np
-
         """
         This function plots a given bias parameter versus time for a single polarimeter
-        
+
         Inputs
         polarimeter STRING  the id of the polarimeter
         vgate       TUPLE   vgate[0] - FLOAT ARRAY an array of floats containing the time values
@@ -703,26 +1011,14 @@ class PinchOffAnalysis:
 
         colors = list(mcolors.CSS4_COLORS.values())
 
-        amps = np.reshape(self.amps, (2, 3))
+        amps = self._amps_2x3
         fig, axes = pl.subplots(2, 3, figsize=(35, 30))
         plot_title = "Polarimeter " + polarimeter
         fig.suptitle(plot_title)
-        newtime_v = [[[] for j in [1, 2, 3]] for i in [0, 1]]
-        newtime_i = [[[] for j in [1, 2, 3]] for i in [0, 1]]
-        startv = 0
-        starti = 0
 
         # Produce a fake time vector that does not contain the gaps
-        for row in [0, 1]:
-            for col in [0, 1, 2]:
-                for xv, xi in zip(vgate[0][row][col], idrain[0][row][col]):
-                    dumv = list(np.arange(len(xv)) + startv)
-                    startv = startv + len(xv)
-                    newtime_v[row][col].append(dumv)
-
-                    dumi = list(np.arange(len(xi)) + starti)
-                    starti = starti + len(xi)
-                    newtime_i[row][col].append(dumi)
+        newtime_v = self._gapless_times(vgate[0])
+        newtime_i = self._gapless_times(idrain[0])
 
         for row in [0, 1]:
             for col in [0, 1, 2]:
@@ -763,35 +1059,35 @@ class PinchOffAnalysis:
     # Plot Sci curves versus time       #####
     #########################################
 
-    def sci_plot(self, polarimeters="All", image="png"):
-        import striptease
-        import pylab as pl
-        import numpy as np
-        from scipy.optimize import curve_fit
-        import pickle
-        from datetime import datetime
-        import matplotlib.colors as mcolors
-
+    def sci_plot(self, polarimeters="All", image="png", max_workers=1):
         """
-        This function plots scientific data versus time given a certain configuration stored into self.configuration. 
-        If self.configuration is empty the function first extracts the configuration for all tested 
+        This function plots scientific data versus time given a certain configuration stored into self.configuration.
+        If self.configuration is empty the function first extracts the configuration for all tested
         polarimeters
-        
+
         Inputs
         polarimeters LIST of STRING values  List of polarimeters to plot ('All' plots all polarimeters)
         image        STRING         the format of the output plot ('svg, 'png', 'pdf')
-        
+        max_workers  INT            number of processes used to save the plots (default 1;
+                                    None uses one process per CPU)
+
         Output
         None (plots are saved as files)
-        
+
         Notes
-        The procedure produces for each polarimeter and for each tested amplifers one plot with 
-        eight subplots four for PWR data and four for DEM data. 
-        
+        The procedure produces for each polarimeter and for each tested amplifers one plot with
+        eight subplots four for PWR data and four for DEM data.
+
         """
 
         diodes = ["Q1", "Q2", "U1", "U2"]
         data_types = ["PWR", "DEM"]
+        # The order of the keys sets the layout of the subplots in sci_plot_single
+        channels = [
+            (diode, data_type, "%s_%s" % (diode, data_type))
+            for diode in diodes
+            for data_type in data_types
+        ]
 
         if len(self.configuration) == 0:
             print("Generating instrument configuration")
@@ -804,21 +1100,16 @@ class PinchOffAnalysis:
         if polarimeters == "All":
             polarimeters = self.get_tested_polarimeters(tags=main_tags)
 
-        amps = np.reshape(self.amps, (2, 3))
+        amps = self._amps_2x3
 
         output = {}
+        plot_calls = []
 
         for pol in polarimeters:
 
             # Initialize matrices
-            data = {}
-            time = {}
-
-            for diode in diodes:
-                for data_type in data_types:
-                    key = "%s_%s" % (diode, data_type)
-                    data[key] = [[j for j in [1, 2, 3]] for i in [0, 1]]
-                    time[key] = [[j for j in [1, 2, 3]] for i in [0, 1]]
+            data = {key: np.empty((2, 3), dtype=object) for _, _, key in channels}
+            time = {key: np.empty((2, 3), dtype=object) for _, _, key in channels}
 
             # Now we cycle legs ([0,1]) and amps ([0,1,2]) for each element
             # we get all the available currents, the starting configuration point
@@ -829,13 +1120,8 @@ class PinchOffAnalysis:
                     currents = self.get_currents(pol, amps[row, col])
 
                     # Get measured Voltage, current and time values
-                    dumv = {}
-                    dumt = {}
-                    for diode in diodes:
-                        for data_type in data_types:
-                            key = "%s_%s" % (diode, data_type)
-                            dumv[key] = []
-                            dumt[key] = []
+                    dumv = {key: [] for _, _, key in channels}
+                    dumt = {key: [] for _, _, key in channels}
 
                     # Add first point from configuration
                     amp_id = self.amp_tag_translation[amps[row, col]]
@@ -854,16 +1140,12 @@ class PinchOffAnalysis:
 
                         tstart, tend = self.get_times(pol, cur_tag)
 
-                        for diode in diodes:
-                            for data_type in data_types:
-                                key = "%s_%s" % (diode, data_type)
-                                dumv[key] = []
-                                dumt[key] = []
-                                t, values = self.get_sci(
-                                    pol, data_type, diode, tstart, tend
-                                )
-                                dumv[key].append(values[-100:])
-                                dumt[key].append(t[-100:])
+                        t, values = self.get_sci_batch(
+                            pol, data_types, diodes, tstart, tend
+                        )
+                        for diode, data_type, key in channels:
+                            dumv[key].append(values[(data_type, diode)][-100:])
+                            dumt[key].append(t[-100:])
 
                     for current in currents:
                         curtag = "PINCHOFF_IDSET_%s_%s_%smuA" % (
@@ -877,14 +1159,12 @@ class PinchOffAnalysis:
                         tags.append(str(current) + " muA")
                         tstart, tend = self.get_times(pol, curtag)
 
-                        for diode in diodes:
-                            for data_type in data_types:
-                                key = "%s_%s" % (diode, data_type)
-                                t, values = self.get_sci(
-                                    pol, data_type, diode, tstart, tend
-                                )
-                                dumv[key].append(values)
-                                dumt[key].append(t)
+                        t, values = self.get_sci_batch(
+                            pol, data_types, diodes, tstart, tend
+                        )
+                        for diode, data_type, key in channels:
+                            dumv[key].append(values[(data_type, diode)])
+                            dumt[key].append(t)
 
                     #                     # Sort values according to Vgate
                     # #                    dumi = np.array(dumi)
@@ -892,16 +1172,17 @@ class PinchOffAnalysis:
 
                     # #                    dumi = dumi[np.argsort(dumv)]
                     # #                    dumv = np.sort(dumv)
-                    for diode in diodes:
-                        for data_type in data_types:
-                            key = "%s_%s" % (diode, data_type)
-                            data[key][row][col] = dumv[key]
-                            time[key][row][col] = dumt[key]
+                    for _, _, key in channels:
+                        data[key][row, col] = dumv[key]
+                        time[key][row, col] = dumt[key]
 
                     # Now data and time contain, for each key, the scientifica data for the various
                     # current steps of the six amplifiers
 
-            self.sci_plot_single(pol, time, data, tags, image=image)
+            plot_calls.append((pol, time, data, tags, image))
+            self._release_timelines(pol)
+
+        self._run_plots(self.sci_plot_single, plot_calls, max_workers)
 
     # #        if filename == None:
     # #            now = str(datetime.now())
@@ -914,16 +1195,9 @@ class PinchOffAnalysis:
     # return(tags, time, data)
 
     def sci_plot_single(self, polarimeter, time, data, tags, image="png"):
-        import matplotlib
-
-        matplotlib.use("Agg")
-        import matplotlib.pyplot as pl
-        import matplotlib.colors as mcolors
-        import numpy as np
-
         """
         This function plots a given bias parameter versus time for a single polarimeter
-        
+
         Inputs
         polarimeter STRING  the id of the polarimeter
         time       DICT with FLOAT arrays containing the time values
@@ -932,33 +1206,29 @@ class PinchOffAnalysis:
         image       STRING  the format of the output plot ('svg', 'pdf', 'png')
         """
 
-        amps = np.reshape(self.amps, (2, 3))
+        amps = self._amps_2x3
         keys = data.keys()
         keys1 = np.reshape(list(keys), (4, 2))
 
         # Produce a fake time vector that does not contain the gaps
-        newtime = {}
-        for key in keys:
-            start = 0
-            newtime[key] = [[[] for j in [1, 2, 3]] for i in [0, 1]]
-            for row in [0, 1]:
-                for col in [0, 1, 2]:
-                    for xv in data[key][row][col]:
-                        dumt = list(np.arange(len(xv)) + start)
-                        start = start + len(xv)
-                        newtime[key][row][col].append(dumt)
+        newtime = {key: self._gapless_times(data[key]) for key in keys}
+
+        # The same figure is cleared and reused for all the amplifiers
+        fig, axes = pl.subplots(4, 2, figsize=(35, 30))
 
         for row in [0, 1]:
             for col in [0, 1, 2]:
-                fig, axes = pl.subplots(4, 2, figsize=(35, 30))
+                for ax in axes.flat:
+                    ax.cla()
+
                 plot_title = "Polarimeter %s, Amp %s " % (polarimeter, amps[row, col])
                 fig.suptitle(plot_title)
 
                 for row1 in [0, 1, 2, 3]:
                     for col1 in [0, 1]:
                         key = keys1[row1][col1]
-                        for (x, y, t,) in zip(
-                            newtime[key][row][col], data[key][row][col], tags
+                        for x, y, t in zip(
+                            newtime[key][row][col], data[key][row, col], tags
                         ):
                             axes[row1, col1].plot(x, y, label=t)
                             axes[row1, col1].set_title(key)
@@ -979,34 +1249,33 @@ class PinchOffAnalysis:
                     amps[row, col],
                     image,
                 )
-                pl.savefig(filename)
-                pl.close()
+                fig.savefig(filename)
+
+        pl.close(fig)
 
     #########################################
     # Get the configuration of the instrument
     #########################################
     def get_configuration(self, polarimeters):
-        import striptease
-        import numpy as np
-
         """
         This function retrieves the configuration of a given set of polarimeters at the various
         verification points indicated by the tags
-        The configuration is given by: start_time, end_time and the average value of 
+        The configuration is given by: start_time, end_time and the average value of
         ID_SET, VD_set, Vd_hk, Vg_hk, Id_hk in each time window
-        
+
         Inputs
         polarimeters - Array of STRING - polarimeters to be checked
-        
+
         Output
         out - DICT - Dictionary containing 'ID_SET', 'VD_SET', 'VD_HK', 'VG_HK', 'ID_HK'
-        
+
         """
         hklist = ["ID_SET", "VD_SET", "VD_HK", "VG_HK", "ID_HK"]
-        out = {}
-        for curtag in self.verification_tags:
-            out[curtag] = {}
-            for pol in polarimeters:
+        out = {curtag: {} for curtag in self.verification_tags}
+        # Cycle over the polarimeters first, so that their HK timelines can
+        # be released as soon as all the tags have been processed
+        for pol in polarimeters:
+            for curtag in self.verification_tags:
                 tstart, tend = self.get_times(pol, curtag)
                 print(pol, curtag, tstart, tend)
                 out[curtag][pol] = {}
@@ -1022,6 +1291,8 @@ class PinchOffAnalysis:
                         t, values = self.get_hk(group, subgroup, cur_hk, tstart, tend)
                         out[curtag][pol][cur_hk] = np.mean(values)
 
+            self._release_timelines(pol)
+
         self.configuration = out
 
         return out
@@ -1030,13 +1301,10 @@ class PinchOffAnalysis:
     # Save configuration into pickle and text file
     #####################################################
     def save_configuration(self, d, filename, save="both"):
-        import csv
-
         """
         Saves the configuration present in the dictionary d into a pickle and a text
         file. The string "filename" must not have an extension
         """
-        import pickle
 
         if save == "both" or save == "pickle":
             # This dumps the whole configuration into a pickle binary file
@@ -1126,7 +1394,6 @@ class PinchOffAnalysis:
         """
         Saves a csv file containing the configuration map of a given polarimeter
         """
-        import pickle
 
         file_id = open(self.output_folder + filename + ".pickle", "wb")
         pickle.dump(d, file_id)
@@ -1139,14 +1406,19 @@ class PinchOffAnalysis:
     # Get list of tested polarimeters
     #################################
     def get_tested_polarimeters(self, search_tag="PINCHOFF_IDSET", tags=None):
-        import numpy as np
-
         """
         Retrieves the list of the polarimeters tested in the data file
         """
-        filtered = self.get_subtags(search_tag)
-        pols = [o[15:17] for o in filtered]  # Extract the polarimeter string
-        return np.array(list(dict.fromkeys(pols)))  # Remove duplicates
+        # The list of tags changes only in add_tag, which clears the cache
+        pols = self._tested_pols_cache.get(search_tag)
+        if pols is None:
+            filtered = self.get_subtags(search_tag)
+            pols = [o[15:17] for o in filtered]  # Extract the polarimeter string
+            pols = np.array(list(dict.fromkeys(pols)))  # Remove duplicates
+            pols.flags.writeable = False
+            self._tested_pols_cache[search_tag] = pols
+
+        return pols
 
     ###################################
     # Get list of tags matching pattern
@@ -1155,21 +1427,21 @@ class PinchOffAnalysis:
         """
         Retrieves a list of tags matchina search_tag
         """
-        if tags == None:
-            tags = self.tags
+        if tags is not None:
+            return [t.name for t in tags if search_tag in t.name]
 
-        names = [t.name for t in tags]
-        substr = [search_tag]
-        return [
-            str for str in names if any(sub in str for sub in substr)
-        ]  # Filter tags according to the search_tag
+        # self.tags changes only in add_tag, which clears the cache
+        subtags = self._subtag_cache.get(search_tag)
+        if subtags is None:
+            subtags = tuple(t.name for t in self.tags if search_tag in t.name)
+            self._subtag_cache[search_tag] = subtags
+
+        return list(subtags)
 
     ##############################################
     # Get list of currents for a given pol and amp
     ##############################################
     def get_currents(self, pol, amp):
-        import numpy as np
-
         """
         Retrieves the list of tested currents for a given pol and amp
         """
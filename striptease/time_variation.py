@@ -278,7 +278,7 @@ class timevariation:
 
         for pp in pol:
             print(" Case :", pp)
-            time0, dataX0 = self.dfile.load_sci(pp, data_type)
+            time0, dataX0 = self.dfile.load_sci(pp, data_type, astropy_time=True)
             report[pp] = lookfor_timevariation(time0, step_ref=1.5, silent=True)
         self.scitime = {**report}
         return report
@@ -312,7 +312,7 @@ class timevariation:
         for kk in kcases:
             print("\n --> Plotting " + kk)
             report = self.scitime[kk]
-            time0, pwrX0 = self.dfile.load_sci(kk, data_type)
+            time0, pwrX0 = self.dfile.load_sci(kk, data_type, astropy_time=True)
             tt = time0.value
             xx = np.arange(len(tt))
 
@@ -526,7 +526,7 @@ class timevariation:
         using the two approches and indices used.
         """
         for kk in self.scitime.keys():
-            time0, _ = self.dfile.load_sci(kk, "PWR")
+            time0, _ = self.dfile.load_sci(kk, "PWR", astropy_time=True)
             rr = self.scitime[kk]
             #
             if idname is not None:
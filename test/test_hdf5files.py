@@ -0,0 +1,322 @@
+# -*- encoding: utf-8 -*-
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import h5py
+import numpy as np
+import pytest
+
+from astropy.time import Time
+
+from striptease import (
+    DataFile,
+    MjdArray,
+    Tag,
+    get_hk_descriptions,
+    mjd_to_time,
+    scan_data_path,
+)
+from striptease.hdf5files import (
+    extract_mean_from_time_range,
+    get_group_subgroup,
+    parse_datetime_from_filename,
+    scan_board_names,
+    scan_polarimeter_names,
+)
+
+NUM_OF_SAMPLES = 10
+
+SCI_DTYPE = np.dtype(
+    [("m_jd", "f8")]
+    + [
+        (f"{data_type}{detector}", "i4")
+        for data_type in ("DEM", "PWR")
+        for detector in ("Q1", "Q2", "U1", "U2")
+    ]
+)
+
+TAGS_DTYPE = np.dtype(
+    [
+        ("id", "i8"),
+        ("mjd_start", "f8"),
+        ("mjd_end", "f8"),
+        ("tag", "S32"),
+        ("start_comment", "S4096"),
+        ("end_comment", "S4096"),
+    ]
+)
+
+HK_DTYPE = np.dtype([("m_jd", "f8"), ("value", "i4")])
+
+BIAS_HK_NAMES = (
+    [f"VPIN{x}_HK" for x in range(4)]
+    + [f"IPIN{x}_HK" for x in range(4)]
+    + [f"{hk}{x}_HK" for hk in ("VD", "VG", "ID") for x in range(6)]
+    + ["VG4A_HK", "VG5A_HK"]
+)
+
+
+def create_test_file(path, compression=None):
+    file_name = path / "2019_11_12_05-34-17.h5"
+
+    with h5py.File(file_name, "w") as outf:
+        scidata = np.zeros(NUM_OF_SAMPLES, dtype=SCI_DTYPE)
+        scidata["m_jd"] = 58799.0 + np.arange(NUM_OF_SAMPLES) / 86400.0
+        for idx, name in enumerate(SCI_DTYPE.names[1:]):
+            scidata[name] = np.arange(NUM_OF_SAMPLES) + 100 * idx
+
+        # Compressed datasets cannot be memory-mapped, so they are read
+        # through h5py
+        outf.create_dataset("POL_G0/pol_data", data=scidata, compression=compression)
+
+        for idx, name in enumerate(BIAS_HK_NAMES):
+            hkdata = np.zeros(NUM_OF_SAMPLES, dtype=HK_DTYPE)
+            hkdata["m_jd"] = scidata["m_jd"]
+            hkdata["value"] = np.arange(NUM_OF_SAMPLES) + 100 * idx
+            outf.create_dataset(f"POL_G0/BIAS/{name}", data=hkdata)
+
+        tags = np.zeros(2, dtype=TAGS_DTYPE)
+        tags["id"] = [1, 2]
+        tags["mjd_start"] = [58799.0, 58799.0 + 5.0 / 86400.0]
+        tags["mjd_end"] = [58799.0 + 4.0 / 86400.0, 58799.0 + 9.0 / 86400.0]
+        tags["tag"] = [b"FIRST_TAG", b"SECOND_TAG"]
+        tags["start_comment"] = [b"start 1", b"start 2"]
+        tags["end_comment"] = [b"end 1", b"end 2"]
+        outf.create_dataset("TAGS/tag_data", data=tags)
+
+    return file_name
+
+
+def test_parse_datetime_from_filename():
+    assert parse_datetime_from_filename("/data/2019_11_12_05-34-17.h5") == datetime(
+        2019, 11, 12, 5, 34, 17
+    )
+
+    for name in ("2019_11_12_05-34-17.hdf5", "2019_13_12_05-34-17.h5", "test.h5"):
+        with pytest.raises(RuntimeError):
+            parse_datetime_from_filename(name)
+
+
+def test_scan_group_names():
+    group_names = ["BOARD_G", "COMMANDS", "LOG", "POL_G0", "POL_G6", "POL_G0_X"]
+    assert scan_board_names(group_names) == {"G"}
+    assert scan_polarimeter_names(group_names) == {"G0", "G6"}
+
+
+def test_tags(tmp_path):
+    with DataFile(create_test_file(tmp_path)) as inpf:
+        assert len(inpf.tags) == 2
+        assert inpf.tags[0] == Tag(
+            1, 58799.0, 58799.0 + 4.0 / 86400.0, "FIRST_TAG", "start 1", "end 1"
+        )
+        assert inpf.tags[1].name == "SECOND_TAG"
+        assert inpf.tags[-1].end_comment == "end 2"
+        assert [x.name for x in inpf.tags] == ["FIRST_TAG", "SECOND_TAG"]
+        assert list(inpf.tags[1:]) == [inpf.tags[1]]
+
+        assert np.all(inpf.tags.id == [1, 2])
+        assert np.all(inpf.tags.mjd_start < inpf.tags.mjd_end)
+        assert list(inpf.tags.name) == ["FIRST_TAG", "SECOND_TAG"]
+        assert inpf.tags.end_comment[0] == "end 1"
+
+
+def test_shared_file(tmp_path):
+    file_name = create_test_file(tmp_path)
+    first = DataFile(file_name)
+    second = DataFile(file_name)
+
+    first.read_file_metadata()
+    second.read_file_metadata()
+    assert first.hdf5_file is second.hdf5_file
+
+    first.close_file()
+    assert first.hdf5_file is None
+    assert second.hdf5_file
+    assert second.tags[0].name == "FIRST_TAG"
+
+    # A different chunk cache requires a different h5py.File object
+    third = DataFile(file_name, rdcc_nbytes=1024 * 1024)
+    third.read_file_metadata()
+    assert third.hdf5_file is not second.hdf5_file
+    third.close_file()
+
+    # The file was not written in SWMR mode, so it is opened normally
+    with DataFile(file_name, swmr=True) as swmr_file:
+        assert swmr_file.hdf5_file is not second.hdf5_file
+        assert not swmr_file.hdf5_file.swmr_mode
+        assert swmr_file.tags[0].name == "FIRST_TAG"
+
+    hdf5_file = second.hdf5_file
+    second.close_file()
+    assert not hdf5_file
+
+    # Closing a file that is not open must do nothing
+    second.close_file()
+    DataFile(file_name).close_file()
+
+
+def test_shared_file_threads(tmp_path):
+    file_name = create_test_file(tmp_path)
+
+    # Files are opened outside the lock: concurrent opens of the same file
+    # must still end up sharing one h5py.File
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        files = list(executor.map(lambda _: DataFile(file_name), range(8)))
+        list(executor.map(lambda x: x.read_file_metadata(), files))
+
+    assert all(x.hdf5_file is files[0].hdf5_file for x in files)
+
+    hdf5_file = files[0].hdf5_file
+    for cur_file in files[1:]:
+        cur_file.close_file()
+        assert hdf5_file
+
+    files[0].close_file()
+    assert not hdf5_file
+
+
+@pytest.mark.parametrize("compression", [None, "gzip"])
+def test_load_sci(tmp_path, compression):
+    with DataFile(create_test_file(tmp_path, compression)) as inpf:
+        time, data = inpf.load_sci("G0", "DEM", "Q2")
+        assert np.allclose(time.mjd, 58799.0 + np.arange(NUM_OF_SAMPLES) / 86400.0)
+        assert np.all(data == np.arange(NUM_OF_SAMPLES) + 100)
+
+        time, data = inpf.load_sci("POL_G0", "PWR", ("Q1", "U2"))
+        assert data.dtype.names == ("PWRQ1", "PWRU2")
+        assert np.all(data["PWRQ1"] == np.arange(NUM_OF_SAMPLES) + 400)
+        assert np.all(data["PWRU2"] == np.arange(NUM_OF_SAMPLES) + 700)
+
+        time, data = inpf.load_sci("G0", "PWR", ("Q1", "U2"), as_soa=True)
+        assert sorted(data.keys()) == ["PWRQ1", "PWRU2"]
+        assert data["PWRU2"].flags.c_contiguous
+        assert np.all(data["PWRU2"] == np.arange(NUM_OF_SAMPLES) + 700)
+
+        buffer = inpf.allocate_sci_buffer("G0", "DEM", ("Q1", "U2"))
+        time, data = inpf.load_sci("G0", "DEM", ("Q1", "U2"), out=buffer)
+        assert data is buffer
+        assert np.all(data["DEMU2"] == np.arange(NUM_OF_SAMPLES) + 300)
+
+        buffer = inpf.allocate_sci_buffer("G0", "PWR", "Q2")
+        time, data = inpf.load_sci("G0", "PWR", "Q2", out=buffer)
+        assert data is buffer
+        assert np.all(data == np.arange(NUM_OF_SAMPLES) + 500)
+
+        time, data = inpf.load_sci("G0", ("DEM", "PWR"), "U1", as_soa=True)
+        assert sorted(data.keys()) == ["DEMU1", "PWRU1"]
+        assert np.all(data["PWRU1"] == np.arange(NUM_OF_SAMPLES) + 600)
+
+        time, data = inpf.load_sci("G0", ["PWR", "DEM"])
+        assert len(data.dtype.names) == 8
+        assert data.dtype.names[0] == "PWRQ1"
+        assert np.all(data["DEMU2"] == np.arange(NUM_OF_SAMPLES) + 300)
+
+        time, data = inpf.load_sci("G0", "DEM", astropy_time=True)
+        assert isinstance(time, Time)
+        assert data.dtype.names == ("DEMQ1", "DEMQ2", "DEMU1", "DEMU2")
+        assert np.all(data["DEMU1"] == np.arange(NUM_OF_SAMPLES) + 200)
+
+
+def test_get_average_biases(tmp_path):
+    with DataFile(create_test_file(tmp_path)) as inpf:
+        biases = inpf.get_average_biases("G0")
+        biases_in_range = inpf.get_average_biases(
+            "G0", time_range=(58799.0 + 2.0 / 86400.0, 58799.0 + 7.5 / 86400.0)
+        )
+
+    for idx, name in enumerate(BIAS_HK_NAMES):
+        field = name[:-3].lower()
+        assert getattr(biases, field) == np.mean(np.arange(NUM_OF_SAMPLES)) + 100 * idx
+        assert (
+            getattr(biases_in_range, field) == np.mean([2, 3, 4, 5, 6, 7]) + 100 * idx
+        )
+
+
+def test_extract_mean_from_time_range():
+    times = Time(58799.0 + np.arange(10) / 10.0, format="mjd")
+    values = np.arange(10) * 1.0
+
+    assert extract_mean_from_time_range(times, values) == 4.5
+    assert extract_mean_from_time_range(times.mjd, values, (58799.1, 58799.9)) == 5.0
+    assert extract_mean_from_time_range(times, values, (58799.1, 58799.9)) == 5.0
+    assert (
+        extract_mean_from_time_range(
+            times, values, (58799.1, 58799.9), assume_sorted=False
+        )
+        == 5.0
+    )
+
+    # Too few samples in the range: the function should pick the samples
+    # acquired just before the extrema
+    assert np.all(
+        extract_mean_from_time_range(times, values, (58799.15, 58799.35)) == [1.0, 3.0]
+    )
+
+
+def test_mjd_array():
+    mjd = 58799.0 + np.arange(NUM_OF_SAMPLES) / 86400.0
+    times = MjdArray(mjd)
+    astropy_times = Time(mjd, format="mjd")
+
+    assert np.all(times.mjd == mjd)
+    assert np.all(times.value == mjd)
+    assert np.allclose(times.unix, astropy_times.unix)
+    assert np.allclose(times[2:4].unix, astropy_times[2:4].unix)
+    assert times.to_time()[3] == astropy_times[3]
+    assert mjd_to_time(mjd)[3] == astropy_times[3]
+
+    # Attributes not implemented by MjdArray are taken from astropy.time.Time
+    assert np.all(times.datetime == astropy_times.datetime)
+
+
+def test_hk_descriptions():
+    hklist = get_hk_descriptions("BIAS", "POL")
+    assert hklist.group == "BIAS"
+    assert hklist.subgroup == "POL"
+    assert "VG4A_SET" in hklist
+    assert "VG4A_SET" in list(hklist)
+    assert len(hklist) == len(dict(hklist.items()))
+    assert hklist.get("NONEXISTENT") is None
+    assert str(hklist).startswith("Parameters for BIAS/POL\n")
+
+    hklist = get_hk_descriptions("daq", "board")
+    assert (hklist.group, hklist.subgroup) == ("DAQ", "BOARD")
+
+
+def test_scan_data_path(tmp_path):
+    create_test_file(tmp_path)
+    (tmp_path / "subdir").mkdir()
+    (tmp_path / "subdir" / "2019_11_11_10-00-00.h5").write_bytes(b"not a HDF5 file")
+
+    # This file has no date in its name
+    with h5py.File(tmp_path / "joined.h5", "w"):
+        pass
+
+    expected_datetimes = [
+        datetime(2019, 11, 11, 10, 0, 0),
+        datetime(2019, 11, 12, 5, 34, 17),
+        None,
+    ]
+
+    # Symbolic links to directories are not followed
+    (tmp_path / "subdir" / "loop").symlink_to(tmp_path, target_is_directory=True)
+
+    files = scan_data_path(tmp_path)
+    assert [x.datetime for x in files] == expected_datetimes
+    assert all(x.hdf5_file is None for x in files)
+    assert files[1].polarimeters == {"G0"}
+    files[1].close_file()
+
+    files = scan_data_path(tmp_path, read_metadata=True, max_workers=2)
+    assert [x.datetime for x in files] == expected_datetimes
+    assert files[1].hdf5_file is not None
+
+    for cur_file in files:
+        cur_file.close_file()
+
+
+def test_get_group_subgroup():
+    assert get_group_subgroup("VG4A_SET") == ("BIAS", "POL")
+    assert get_group_subgroup("DET0_BIAS") == ("DAQ", "POL")
+    assert get_group_subgroup("NONEXISTENT") == (None, None)
@@ -0,0 +1,145 @@
+# -*- encoding: utf-8 -*-
+
+import numpy as np
+
+from striptease.noise_generator import NoiseGenerator, _spectrum_shape
+
+
+def test_noise_kernel():
+    gen = NoiseGenerator()
+
+    noise = gen.noise_kernel(0.05, 3.0, 50.0, -1.5, 1000, 123)
+    assert noise.shape == (1000,)
+    assert noise.dtype == np.float64
+
+    # The same seed must produce the same realization
+    assert np.all(noise == gen.noise_kernel(0.05, 3.0, 50.0, -1.5, 1000, 123))
+    assert np.any(noise != gen.noise_kernel(0.05, 3.0, 50.0, -1.5, 1000, 124))
+
+    # The DC component is always zero
+    assert np.abs(np.mean(noise)) < 1e-12
+
+
+def test_spectrum_shape():
+    shape = _spectrum_shape(0.05, -1.5, 1000, 50.0, 1e-30, 1e30)
+    assert shape.shape == (500,)
+    assert not shape.flags.writeable
+
+    # Without cutoffs, this is a power law
+    freq = np.arange(1, 501) * 50.0 / 1000
+    assert np.allclose(shape, (0.05 / freq) ** 0.75)
+
+    # The same parameters return the same (cached) array
+    assert _spectrum_shape(0.05, -1.5, 1000, 50.0, 1e-30, 1e30) is shape
+
+
+def test_generate_noise():
+    gen = NoiseGenerator(total_power=True)
+
+    noise = gen.generate_noise(30.0, 6.0, [20.0, 30.0], -1.0, 50.0, 100.0)
+    assert noise.shape == (5000,)
+    assert np.all(np.isfinite(noise))
+
+    # The offset is the sum of the signal and noise temperatures
+    assert np.abs(np.mean(noise) - 50.0) < 0.01
+
+    # The number of samples is always even: 100.02 s at 50 Hz are 5001 samples
+    noise = gen.generate_noise(30.0, 6.0, [20.0, 30.0], -1.0, 50.0, 100.02)
+    assert noise.shape == (5000,)
+
+
+def test_tant():
+    gen = NoiseGenerator()
+
+    # In the Rayleigh-Jeans limit, the two temperatures are the same
+    assert np.isclose(gen.tant(300.0, 1e6), 300.0)
+    assert gen.tant(20.0, 43e9) < 20.0
+
+    temperatures = np.array([20.0, 300.0])
+    assert np.allclose(
+        gen.tant(temperatures, 43e9), [gen.tant(x, 43e9) for x in temperatures]
+    )
+
+
+def test_fast_length():
+    # 2 * 2503 samples: 2503 is a prime number
+    gen = NoiseGenerator(fast_length=True, add_offset=False)
+
+    noise = gen.generate_noise(30.0, 6.0, [1.0, 0.05], -1.0, 50.0, 100.12)
+    assert noise.shape == (5120,)
+
+
+def test_generate_noise_batch():
+    gen = NoiseGenerator(total_power=True, corr=False)
+
+    noise = gen.generate_noise_batch(
+        30.0, 6.0, [20.0, 30.0], -1.0, 50.0, 100.0, n_realizations=3
+    )
+    assert noise.shape == (3, 5000)
+    assert np.allclose(
+        noise[0], gen.generate_noise(30.0, 6.0, [20.0, 30.0], -1.0, 50.0, 100.0)
+    )
+
+    # Realizations must be independent
+    assert np.all(noise[0] != noise[1])
+    assert np.all(noise[1] != noise[2])
+
+
+def test_generate_noise_float32():
+    gen = NoiseGenerator(total_power=True)
+
+    noise = gen.generate_noise(
+        30.0, 6.0, [20.0, 30.0], -1.0, 50.0, 100.0, dtype=np.float32
+    )
+    assert noise.dtype == np.float32
+    assert np.abs(np.mean(noise) - 50.0) < 0.01
+
+
+def test_generate_differential_noise():
+    gen = NoiseGenerator(wn_only=True)
+
+    # Differential streams have no offset
+    noise = gen.generate_noise(30.0, 6.0, [2.0, 0.05], -1.0, 50.0, 100.0)
+    assert noise.shape == (5000,)
+    assert np.abs(np.mean(noise)) < 0.2
+    assert np.abs(np.std(noise) - 2.0) < 0.1
+
+
+def test_total_power_components_cache():
+    gen = NoiseGenerator(total_power=True, corr=False)
+
+    first = gen.generate_noise(30.0, 6.0, [20.0, 30.0], -1.0, 50.0, 100.0)
+    assert np.all(
+        first == gen.generate_noise(30.0, 6.0, [20.0, 30.0], -1.0, 50.0, 100.0)
+    )
+
+    # Changing a parameter must invalidate the cached quantities
+    gen.A *= 2
+    assert np.any(
+        first != gen.generate_noise(30.0, 6.0, [20.0, 30.0], -1.0, 50.0, 100.0)
+    )
+
+
+def test_generate_noise_rng():
+    gen = NoiseGenerator(total_power=True)
+
+    noise = gen.generate_noise_batch(
+        30.0,
+        6.0,
+        [20.0, 30.0],
+        -1.0,
+        50.0,
+        100.0,
+        n_realizations=2,
+        rng=np.random.default_rng(42),
+    )
+    assert np.all(np.isfinite(noise))
+    assert np.all(noise[0] != noise[1])
+
+    # The same generator state must produce the same streams
+    assert np.all(
+        noise[0]
+        == gen.generate_noise(
+            30.0, 6.0, [20.0, 30.0], -1.0, 50.0, 100.0, rng=np.random.default_rng(42)
+        )
+    )
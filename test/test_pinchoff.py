@@ -0,0 +1,212 @@
+# -*- encoding: utf-8 -*-
+
+import pickle
+import subprocess
+import sys
+import threading
+
+import numpy as np
+import pytest
+
+from scipy.optimize import curve_fit
+
+from striptease import DataFile
+from striptease.pinchoff import PinchOffAnalysis
+
+from test_hdf5files import create_test_file
+
+
+class FakeDataFile:
+    def __init__(self, tags):
+        self.tags = tags
+
+    def read_file_metadata(self):
+        pass
+
+
+@pytest.fixture
+def analysis(tmp_path):
+    return PinchOffAnalysis(FakeDataFile([]), output_folder=str(tmp_path) + "/")
+
+
+@pytest.mark.parametrize("degree", [1, 2])
+def test_fit_polynomial(analysis, degree):
+    # Gate voltages are in mV, so the Vandermonde matrix is ill-conditioned
+    xvalues = np.linspace(-900.0, -600.0, 6)
+    yvalues = 1e-4 * xvalues * xvalues + 0.3 * xvalues + 250.0
+    yvalues += np.array([0.5, -0.3, 0.2, -0.6, 0.4, -0.1])
+
+    function = analysis.quad if degree == 2 else analysis.lin
+    params, cov = curve_fit(function, xvalues, yvalues)
+
+    (coeffs, fit_cov), rsquare = analysis._fit_polynomial(xvalues, yvalues, degree)
+    assert np.allclose(coeffs, params, rtol=1e-6)
+    assert np.allclose(fit_cov, cov, rtol=1e-4)
+    assert np.isclose(
+        rsquare, analysis.rsquare(xvalues, yvalues, (params, cov), function)
+    )
+
+    with pytest.raises(ValueError):
+        analysis._fit_polynomial(xvalues[:degree], yvalues[:degree], degree)
+
+    with pytest.raises(ValueError):
+        analysis._fit_polynomial(xvalues, np.full(6, np.nan), degree)
+
+
+def test_save_fits_npz(analysis, tmp_path):
+    xvalues = np.linspace(-900.0, -600.0, 6)
+    yvalues = 1e-4 * xvalues * xvalues + 0.3 * xvalues + 250.0
+    yvalues += np.array([0.5, -0.3, 0.2, -0.6, 0.4, -0.1])
+
+    quad = analysis._fit_polynomial(xvalues, yvalues, 2)
+    lin = analysis._fit_polynomial(xvalues, yvalues, 1)
+    output = {
+        pol: {amp: {"quadratic": quad, "linear": lin} for amp in analysis.amps}
+        for pol in ("G0", "R3")
+    }
+    # A failed fit
+    output["R3"]["HB2"]["linear"] = (None, None)
+
+    filename = tmp_path / "fits.npz"
+    analysis._save_fits_npz(filename, output)
+
+    with np.load(filename) as fits:
+        assert list(fits["polarimeters"]) == ["G0", "R3"]
+        assert fits["amps"][1, 1] == "HB2"
+
+        assert fits["params_quad"].shape == (2, 2, 3, 3)
+        assert fits["cov_quad"].shape == (2, 2, 3, 3, 3)
+        assert np.all(fits["params_quad"] == quad[0][0])
+        assert np.all(fits["cov_quad"] == quad[0][1])
+        assert np.all(fits["rsq_quad"] == quad[1])
+
+        assert np.all(fits["params_lin"][0] == lin[0][0])
+        assert np.all(fits["cov_lin"][0] == lin[0][1])
+        assert np.all(fits["rsq_lin"][0] == lin[1])
+
+        assert np.all(np.isnan(fits["params_lin"][1, 1, 1]))
+        assert np.all(np.isnan(fits["cov_lin"][1, 1, 1]))
+        assert np.isnan(fits["rsq_lin"][1, 1, 1])
+        assert np.all(fits["params_lin"][1, 0] == lin[0][0])
+
+
+def test_segment_means(analysis):
+    segments = [np.arange(4, dtype=np.int32), np.array([], dtype=np.int32), [7, 9]]
+    means = analysis._segment_means(segments)
+    assert means.dtype == np.float64
+    assert means[0] == 1.5
+    assert np.isnan(means[1])
+    assert means[2] == 8.0
+
+    assert np.all(np.isnan(analysis._segment_means([[], []])))
+
+
+def test_import_keeps_backend():
+    # Run in a new interpreter, as the module is already imported here
+    code = (
+        "import matplotlib; matplotlib.use('svg'); import striptease.pinchoff; "
+        "print(matplotlib.get_backend())"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], check=True, stdout=subprocess.PIPE
+    )
+    assert result.stdout.decode().strip() == "svg"
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_run_plots(analysis, tmp_path, max_workers):
+    xvalues = np.linspace(-900.0, -600.0, 6)
+    yvalues = 0.3 * xvalues + 250.0
+    fit = analysis._fit_polynomial(xvalues, yvalues, 1)
+
+    def matrix(value):
+        result = np.empty((2, 3), dtype=object)
+        result.fill(value)
+        return result
+
+    calls = [
+        (
+            pol,
+            matrix(xvalues),
+            matrix(yvalues),
+            matrix(None),
+            matrix(fit[0]),
+            matrix(None),
+            matrix(fit[1]),
+            False,
+            "png",
+        )
+        for pol in ("G0", "R3")
+    ]
+    # The data file is not sent to the worker processes
+    analysis.data = threading.Lock()
+    analysis._run_plots(analysis.plot_IV_single, calls, max_workers)
+    assert isinstance(analysis.data, type(threading.Lock()))
+
+    assert sorted(x.name for x in tmp_path.iterdir()) == [
+        "IVplot_G0.png",
+        "IVplot_R3.png",
+    ]
+
+
+def test_unique_in_order(analysis):
+    currents = np.array(["20", "100", "20", "50", "100"])
+    assert list(analysis._unique_in_order(currents)) == ["20", "100", "50"]
+    assert len(analysis._unique_in_order(np.array([], dtype=str))) == 0
+
+
+def test_release_timelines(tmp_path):
+    with DataFile(create_test_file(tmp_path)) as inpf:
+        analysis = PinchOffAnalysis(inpf, output_folder=str(tmp_path) + "/")
+        t, values = analysis.get_hk(
+            "BIAS", "POL_G0", "VG0_HK", 58799.0 + 2.0 / 86400.0, 58799.0 + 5.5 / 86400.0
+        )
+        assert np.all(values == [1402, 1403, 1404, 1405])
+        assert values.base is None
+        assert len(analysis._hk_cache) == 1
+
+        analysis._release_timelines("R3")
+        assert len(analysis._hk_cache) == 1
+        analysis._release_timelines("G0")
+        assert len(analysis._hk_cache) == 0
+
+
+def test_get_sci_batch(tmp_path):
+    with DataFile(create_test_file(tmp_path)) as inpf:
+        analysis = PinchOffAnalysis(inpf, output_folder=str(tmp_path) + "/")
+        tstart, tend = 58799.0 + 2.0 / 86400.0, 58799.0 + 5.5 / 86400.0
+
+        t, values = analysis.get_sci_batch(
+            "G0", ["PWR", "DEM"], ["Q1", "U2"], tstart, tend
+        )
+        assert len(t) == 4
+        assert sorted(values.keys()) == [
+            ("DEM", "Q1"),
+            ("DEM", "U2"),
+            ("PWR", "Q1"),
+            ("PWR", "U2"),
+        ]
+        assert np.all(values[("DEM", "Q1")] == [2, 3, 4, 5])
+        assert np.all(values[("PWR", "U2")] == [702, 703, 704, 705])
+        assert values[("PWR", "U2")].base is None
+
+        t_single, single = analysis.get_sci("G0", "DEM", "Q2", tstart, tend)
+        assert np.all(t_single == t)
+        assert np.all(single == [102, 103, 104, 105])
+
+        t, values = analysis.get_sci_batch("G0", [], ["Q1"], tstart, tend)
+        assert len(t) == 0
+        assert values == {}
+
+        # One table read per polarimeter
+        assert list(analysis._sci_cache.keys()) == ["G0"]
+        analysis._release_timelines("G0")
+        assert len(analysis._sci_cache) == 0
+
+
+def test_pickle(analysis):
+    # Copies keep the data file and the caches
+    analysis._hk_cache[("BIAS", "POL_G0", "VG0_HK")] = (np.zeros(2), np.ones(2))
+    copy = pickle.loads(pickle.dumps(analysis))
+    assert isinstance(copy.data, FakeDataFile)
+    assert list(copy._hk_cache.keys()) == [("BIAS", "POL_G0", "VG0_HK")]